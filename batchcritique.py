@@ -0,0 +1,203 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from embedding import embed_images, get_similar_files
+from querygraph import queryImagesBatch
+from tracing import span, trace_request
+from vllm import call_vllm
+
+# 批量评论：一次处理一个目录或清单中的全部作品
+#   分块批量编码 -> 一次向量化相似检索 -> 一次查询全部参考作品的维度得分 -> 并发调用多模态模型
+# 每张作品的结果追加写入JSONL，重新运行时跳过已成功的作品
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+DEFAULT_PROMPT = "How do you think of my artwork and your suggestions?"
+
+
+def collect_items(source, prompt=DEFAULT_PROMPT):
+    """
+    读取待评论的作品，返回[{"image": 路径, "prompt": 问题}]。
+    source可以是目录（其中的全部图片），或清单文件：
+        .csv    需要path列，可选prompt列
+        .jsonl  每行{"path": ..., "prompt": ...}，prompt可选
+        其他    每行一个图片路径
+    清单中的相对路径相对于清单所在目录。
+    """
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+        return [{"image": os.path.join(source, n), "prompt": prompt} for n in names]
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        if source.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        elif source.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = [{"path": line.strip()} for line in f if line.strip()]
+    return [
+        {"image": os.path.join(base, row["path"]), "prompt": row.get("prompt") or prompt}
+        for row in rows
+    ]
+
+
+def load_done(output_path):
+    """已成功评论的作品路径（用于断点续跑）"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断时可能留下不完整的最后一行
+                continue
+            if record.get("status") == "ok":
+                done.add(record["image"])
+    return done
+
+
+class ResultWriter:
+    """线程安全地向JSONL追加结果，每条都flush+fsync，中断最多丢失正在进行中的请求"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        torn = os.path.exists(path) and os.path.getsize(path) > 0
+        if torn:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if torn:
+            self._file.write("\n")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def critique_batch(items, client, model, graph, output_path, url=None, username=None, password=None,
+                   num=1, batch_size=32, chunk_size=128, concurrency=4, cache=None, backend=None):
+    """
+    批量评论items（collect_items的返回值），结果追加写入output_path（JSONL）。
+
+    每块chunk_size张作品：批量编码（batch_size张一批）、一次相似检索、一次图谱查询，
+    然后把模型调用提交到concurrency个线程；下一块的编码与上一块的模型调用重叠进行，
+    同时在途的模型调用不超过两块。
+
+    返回：
+        {"total", "skipped", "ok", "failed", "seconds"}
+    """
+    start = time.perf_counter()
+    done = load_done(output_path)
+    todo = [item for item in items if item["image"] not in done]
+    summary = {"total": len(items), "skipped": len(items) - len(todo), "ok": 0, "failed": 0}
+    print(f"共 {len(items)} 张作品，已完成 {summary['skipped']} 张，本次处理 {len(todo)} 张")
+
+    writer = ResultWriter(output_path)
+    lock = threading.Lock()
+
+    def finish(record):
+        writer.write(record)
+        with lock:
+            summary["ok" if record["status"] == "ok" else "failed"] += 1
+            finished = summary["ok"] + summary["failed"]
+        if finished % 10 == 0 or finished == len(todo):
+            elapsed = time.perf_counter() - start
+            print(f"进度 {finished}/{len(todo)}（{finished / elapsed:.2f} 张/秒）")
+
+    def critique_one(item, neighbours, kg):
+        began = time.perf_counter()
+        record = {"image": item["image"], "prompt": item["prompt"], "neighbours": neighbours}
+        with trace_request():
+            try:
+                record["critique"] = call_vllm(client, model, kg, item["prompt"], item["image"], neighbours, cache=cache)
+                record["status"] = "ok"
+            except Exception as e:
+                record["status"] = "error"
+                record["error"] = f"{type(e).__name__}: {e}"
+        record["seconds"] = round(time.perf_counter() - began, 3)
+        finish(record)
+
+    previous = []
+    try:
+        # 离开with时会等待所有已提交的模型调用完成，之后才关闭writer：
+        # 后面的块出错（或Ctrl-C）时，已经在途、已付费的结果仍会写入文件
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for offset in range(0, len(todo), chunk_size):
+                chunk = todo[offset:offset + chunk_size]
+                with span("batch_chunk", images=len(chunk)):
+                    embs, ok = embed_images([item["image"] for item in chunk], batch_size=batch_size)
+                    for item in (item for item, good in zip(chunk, ok) if not good):
+                        finish({"image": item["image"], "prompt": item["prompt"], "status": "error",
+                                "error": "embedding failed"})
+                    chunk = [item for item, good in zip(chunk, ok) if good]
+                    neighbours = get_similar_files(url, username, password, embs[ok], num=num, backend=backend)
+                    kgs = queryImagesBatch(graph, neighbours)
+
+                # 限制在途的模型调用：提交本块之前先等上一块全部完成
+                wait(previous)
+                previous = [
+                    executor.submit(critique_one, item, files, kg)
+                    for item, files, kg in zip(chunk, neighbours, kgs)
+                ]
+            wait(previous)
+    finally:
+        writer.close()
+
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    print(f"完成：成功 {summary['ok']}，失败 {summary['failed']}，跳过 {summary['skipped']}，耗时 {summary['seconds']}s")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量评论一个目录或清单中的作品，结果写入JSONL（可断点续跑）")
+    parser.add_argument("source", help="图片目录，或清单文件（.csv含path列 / .jsonl / 每行一个路径）")
+    parser.add_argument("--output", default="critiques.jsonl")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="清单中没有prompt时使用的问题")
+    parser.add_argument("--num", type=int, default=1, help="每张作品参考的相似作品数")
+    parser.add_argument("--batch-size", type=int, default=32, help="CLIP编码批大小")
+    parser.add_argument("--chunk-size", type=int, default=128, help="每块作品数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时进行的多模态模型调用数")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL", "https://openai.api2d.net/v1"))
+    parser.add_argument("--neo4j-url", default=os.getenv("NEO4J_URI", "neo4j://localhost:7687"))
+    parser.add_argument("--neo4j-username", default=os.getenv("NEO4J_USERNAME", "neo4j"))
+    parser.add_argument("--neo4j-password", default=os.getenv("NEO4J_PASSWORD", ""))
+    parser.add_argument("--no-cache", action="store_true", help="不使用大模型响应缓存")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from langchain_neo4j import Neo4jGraph
+    from openai import OpenAI
+
+    from llmcache import LLMCache
+
+    load_dotenv()
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=args.base_url)
+    graph = Neo4jGraph(url=args.neo4j_url, username=args.neo4j_username, password=args.neo4j_password)
+    critique_batch(
+        collect_items(args.source, args.prompt), client, args.model, graph, args.output,
+        url=args.neo4j_url, username=args.neo4j_username, password=args.neo4j_password,
+        num=args.num, batch_size=args.batch_size, chunk_size=args.chunk_size,
+        concurrency=args.concurrency, cache=None if args.no_cache else LLMCache(),
+    )
+
+
+if __name__ == "__main__":
+    main()
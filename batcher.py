@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    进程内共享的动态批处理编码服务：各会话提交单张图片的预处理结果，
+    后台线程把max_wait_ms窗口内到达的请求（最多max_batch_size个）合并成一次前向计算，
+    每个请求通过Future拿到自己的向量。
+
+    参数：
+        encode_fn: (N, ...) numpy数组 -> (N, dim) 向量
+        max_batch_size: 单批最多合并的请求数
+        max_wait_ms: 第一个请求到达后最多等待多久再凑批
+    """
+
+    def __init__(self, encode_fn, max_batch_size=16, max_wait_ms=10):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._batches = 0
+        self._busy_time = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, pixel_values):
+        """提交单张图片的预处理结果，返回Future，结果为该图片的向量"""
+        if self._closed:
+            raise RuntimeError("EmbeddingBatcher已关闭")
+        future = Future()
+        self._queue.put((pixel_values, future))
+        return future
+
+    def encode(self, pixel_values, timeout=None):
+        return self.submit(pixel_values).result(timeout)
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # 关闭信号：先处理完当前批，再退出
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            futures = [f for _, f in batch if f.set_running_or_notify_cancel()]
+            inputs = [p for p, f in batch if f in futures]
+            if not futures:
+                continue
+            start = time.perf_counter()
+            try:
+                outputs = self.encode_fn(np.stack(inputs))
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+            else:
+                for f, out in zip(futures, outputs):
+                    f.set_result(out)
+            with self._lock:
+                self._busy_time += time.perf_counter() - start
+                self._batches += 1
+                self._requests += len(futures)
+                self._batch_sizes[len(futures)] += 1
+
+    def metrics(self):
+        """队列深度、批大小分布等运行指标"""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": self._batches,
+                "avg_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "busy_seconds": self._busy_time,
+            }
+
+    def close(self, timeout=None):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
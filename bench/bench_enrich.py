@@ -0,0 +1,81 @@
+"""
+tools/enrich_apdd.py 的离线吞吐测试。
+
+在fake_openai.FakeChatServer上对csv/APDD.csv的前若干行运行enrich_csv：
+模拟服务按提取提示词返回JSON（打包或单条），超过--server-rps时返回429 + Retry-After，
+从而覆盖限流与退避重试。
+
+    python bench/bench_enrich.py --rows 200 --concurrency 8 --rps 20 --server-rps 15 --batch-size 4
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_ROOT, "tools"))
+
+from fake_openai import FakeChatServer
+
+PACKED_RE = re.compile(r"labelled \[1\] to \[(\d+)\]")
+LABEL_RE = re.compile(r"^\[(\d+)\] (.*)$", re.MULTILINE)
+
+
+def extraction_result(comment):
+    """确定性的"提取"：评论的第一个分句作为总体评价理由"""
+    first = re.split(r"[,.;]", comment.strip(), maxsplit=1)[0].strip()
+    return {"reason_for_overall": first}
+
+
+def enrichment_responder(body):
+    prompt = body["messages"][-1]["content"]
+    packed = PACKED_RE.search(prompt)
+    if packed:
+        comments = {int(i): text for i, text in LABEL_RE.findall(prompt)}
+        results = [extraction_result(comments.get(i, "")) for i in range(1, int(packed.group(1)) + 1)]
+        return json.dumps({"results": results})
+    comment = prompt.split("Comment:", 1)[1].split("\n", 1)[0]
+    return json.dumps(extraction_result(comment))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在本地模拟服务上测试enrich_apdd的吞吐")
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rps", type=float, default=20.0, help="客户端限速（请求/秒）")
+    parser.add_argument("--server-rps", type=float, default=None, help="模拟服务超过该速率时返回429")
+    parser.add_argument("--latency", type=float, default=0.5, help="模拟补全延迟（秒）")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    import enrich_apdd
+
+    workdir = tempfile.mkdtemp(prefix="enrich-bench-")
+    input_path = os.path.join(workdir, "APDD.csv")
+    output_path = os.path.join(workdir, "APDD_enriched.csv")
+    pd.read_csv(os.path.join(REPO_ROOT, "csv", "APDD.csv"), nrows=args.rows).to_csv(input_path, index=False)
+
+    with FakeChatServer(ttft=args.latency, responder=enrichment_responder, max_rps=args.server_rps) as server:
+        start = time.perf_counter()
+        enrich_apdd.enrich_csv(
+            input_path, output_path, enrich_apdd.PROMPT_TEMPLATE,
+            batch_size=args.batch_size, concurrency=args.concurrency, requests_per_second=args.rps,
+            client=enrich_apdd.create_client(server.base_url),
+        )
+        elapsed = time.perf_counter() - start
+
+    out = pd.read_csv(output_path)
+    filled = out["reason_for_overall"].notna().sum()
+    print(f"\n共 {len(out)} 行，{filled} 行已补全，耗时 {elapsed:.2f}s（{len(out) / elapsed:.1f} 行/秒）；"
+          f"请求 {server.requests} 次，其中 {server.rate_limited} 次返回429")
+
+
+if __name__ == "__main__":
+    main()
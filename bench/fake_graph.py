@@ -0,0 +1,95 @@
+import csv
+import os
+import time
+
+from langchain_neo4j.graphs.graph_store import GraphStore
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_DIR = os.path.join(REPO_ROOT, "csv")
+
+STRUCTURED_SCHEMA = {
+    "node_props": {
+        "Artwork": [{"property": "id", "type": "STRING"}, {"property": "filename", "type": "STRING"}],
+        "Dimension": [{"property": "id", "type": "STRING"}],
+        "Category": [{"property": "id", "type": "STRING"}],
+        "Artstyle": [{"property": "id", "type": "STRING"}],
+        "Subject": [{"property": "id", "type": "STRING"}],
+    },
+    "rel_props": {
+        "HAS_LEVEL": [{"property": "level", "type": "STRING"}, {"property": "reason", "type": "STRING"}],
+    },
+    "relationships": [
+        {"start": "Artwork", "type": "HAS_LEVEL", "end": "Dimension"},
+        {"start": "Artwork", "type": "BELONGS_TO_CATEGORY", "end": "Category"},
+        {"start": "Artwork", "type": "BELONGS_TO_STYLE", "end": "Artstyle"},
+        {"start": "Artwork", "type": "BELONGS_TO_SUBJECT", "end": "Subject"},
+    ],
+    "metadata": {"constraint": [], "index": []},
+}
+
+
+class InMemoryGraph(GraphStore):
+    """
+    Neo4jGraph的确定性替身，数据来自csv/中的CSV（只读）。
+
+    参数化的HAS_LEVEL查询（querygraph.IMAGE_LEVEL_QUERY）按数据如实返回；
+    其他Cypher（如大模型生成的）返回固定的一组HAS_LEVEL行。
+    每次查询sleep latency秒，模拟一次数据库往返。
+    """
+
+    def __init__(self, csv_dir=CSV_DIR, max_artworks=None, latency=0.005, schema_latency=0.05):
+        self.latency = latency
+        self.schema_latency = schema_latency
+        self.queries = 0
+        self.levels = {}
+        ids = {}
+        with open(os.path.join(csv_dir, "Artwork.csv"), newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if max_artworks is not None and len(ids) >= max_artworks:
+                    break
+                ids[row["id"]] = row["filename"]
+        with open(os.path.join(csv_dir, "Artwork_DIMENSION.csv"), newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                filename = ids.get(row["artwork"])
+                if filename is None:
+                    continue
+                self.levels.setdefault(filename, []).append({
+                    "filename": filename,
+                    "dimension": row["dimension"],
+                    "level": row["level"],
+                    "reason": row["reason"] or "",
+                })
+        self.filenames = list(ids.values())
+        self.schema = ""
+        self.structured_schema = {}
+        self.refresh_schema()
+
+    @property
+    def get_schema(self):
+        return self.schema
+
+    @property
+    def get_structured_schema(self):
+        return self.structured_schema
+
+    def refresh_schema(self):
+        time.sleep(self.schema_latency)
+        self.structured_schema = STRUCTURED_SCHEMA
+        self.schema = "\n".join([
+            "Node properties:",
+            *(f"{label} {{{', '.join(p['property'] + ': ' + p['type'] for p in props)}}}"
+              for label, props in STRUCTURED_SCHEMA["node_props"].items()),
+            "The relationships:",
+            *(f"(:{r['start']})-[:{r['type']}]->(:{r['end']})" for r in STRUCTURED_SCHEMA["relationships"]),
+        ])
+
+    def query(self, query, params={}):
+        time.sleep(self.latency)
+        self.queries += 1
+        if "UNWIND $filenames" in query:
+            rows = []
+            for filename in params.get("filenames", []):
+                rows.extend(dict(r) for r in self.levels.get(filename, []))
+            return rows
+        sample = next(iter(self.levels.values()), [])
+        return [{"dimension": r["dimension"], "level": r["level"], "reason": r["reason"]} for r in sample]
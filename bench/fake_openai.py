@@ -0,0 +1,180 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 本地的OpenAI兼容 /chat/completions 服务，延迟和限流可配置，用于基准测试和测试，不访问真实接口
+
+FAKE_CYPHER = (
+    "```cypher\n"
+    "MATCH (a:Artwork)-[r:HAS_LEVEL]->(d:Dimension {id: 'color'}) "
+    "RETURN d.id AS dimension, r.level AS level, r.reason AS reason LIMIT 10\n"
+    "```"
+)
+FAKE_ANSWER = (
+    "**Visual Observation:** The composition places the subject slightly off centre with a muted palette. "
+    "**Evaluation:** Colour harmony is good but the value range is narrow, so depth reads as flat. "
+    "**Improvement Suggestions:** Push the darkest accents further and add a warm highlight near the focal point."
+)
+
+
+def default_responder(body):
+    """根据请求给出确定的回复：Cypher生成的提示词返回Cypher，其他返回一段评论"""
+    text = " ".join(
+        m["content"] if isinstance(m.get("content"), str)
+        else " ".join(p.get("text", "") for p in m.get("content", []) if isinstance(p, dict))
+        for m in body.get("messages", [])
+    )
+    if "Cypher" in text and "Schema" in text:
+        return FAKE_CYPHER
+    return FAKE_ANSWER
+
+
+class FakeChatServer:
+    """
+    本地的OpenAI兼容 /chat/completions 服务。
+
+    参数：
+        ttft: 首个token（非流式时为整个响应）之前等待的秒数
+        token_delay: 流式输出时相邻token之间的秒数
+        responder: 请求体dict -> 回复文本
+        max_rps: 设置后，任意1秒内超过该数量的请求返回429（带Retry-After）
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, ttft=0.3, token_delay=0.01, responder=default_responder,
+                 max_rps=None):
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.responder = responder
+        self.max_rps = max_rps
+        self.requests = 0
+        self.rate_limited = 0
+        self._recent = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                status, payload = fake.handle(body)
+                if status != 200:
+                    self._send_json(status, payload)
+                    return
+                reply = payload
+                time.sleep(fake.ttft)
+                if body.get("stream"):
+                    self._stream(body, reply)
+                else:
+                    self._send_json(200, completion(body, reply))
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, reply):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                tokens = [t + " " for t in reply.split(" ")]
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(fake.token_delay)
+                    self._event(chunk(body, {"content": token}, None))
+                self._event(chunk(body, {}, "stop"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _event(self, payload):
+                self.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def handle(self, body):
+        """返回(状态码, 回复文本或错误内容)；子类可重写以注入其他错误"""
+        if self.max_rps is not None:
+            now = time.monotonic()
+            with self._lock:
+                self._recent = [t for t in self._recent if now - t < 1.0]
+                if len(self._recent) >= self.max_rps:
+                    self.rate_limited += 1
+                    return 429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit"}}
+                self._recent.append(now)
+        return 200, self.responder(body)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def completion(body, reply):
+    words = len(reply.split())
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": words, "total_tokens": words},
+    }
+
+
+def chunk(body, delta, finish_reason):
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="启动本地的OpenAI兼容chat completions模拟服务")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--max-rps", type=float, default=None, help="超过该请求速率时返回429")
+    args = parser.parse_args()
+    server = FakeChatServer(port=args.port, ttft=args.ttft, token_delay=args.token_delay, max_rps=args.max_rps)
+    print(f"模拟chat completions服务已启动: {server.base_url}")
+    server.server.serve_forever()
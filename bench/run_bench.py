@@ -0,0 +1,254 @@
+"""
+离线端到端延迟基准测试。
+
+在本地替身上运行多模态链路（pipeline.run_image_pipeline，即server.get_response_forImage）
+和纯文本链路（querygraph.queryGraphStream，即server.get_response_languageOnly）：
+- fake_openai.FakeChatServer 代替DeepSeek和多模态模型
+- fake_graph.InMemoryGraph 由csv/构建
+- 为数据中的作品合成的向量库和缩略图包
+
+输出各阶段的p50/p95/p99和吞吐量，结果以JSON保存到bench/results/，
+可以与之前提交的结果对比（--compare）。
+
+    python bench/run_bench.py --mode both --requests 50 --concurrency 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+QUESTIONS = [
+    "how to evaluate color",
+    "what makes good composition",
+    "how is light and shadow judged",
+    "what does a good sense of order look like",
+]
+IMAGE_PROMPT = "How do you think of my artwork and your suggestions?"
+
+
+class FakeEncoder:
+    """确定性的CLIP替身：池化后的像素经固定随机投影得到向量，每批固定延迟"""
+
+    name = "fake"
+
+    def __init__(self, dim=512, latency=0.05, seed=0):
+        self.dim = dim
+        self.latency = latency
+        self.projection = np.random.default_rng(seed).normal(size=(3 * 8 * 8, dim)).astype(np.float32)
+
+    def preprocess(self, images):
+        return np.stack([
+            np.asarray(img.convert("RGB").resize((224, 224)), dtype=np.float32).transpose(2, 0, 1) / 255.0
+            for img in images
+        ])
+
+    def encode(self, pixel_values):
+        time.sleep(self.latency)
+        pooled = pixel_values.reshape(len(pixel_values), 3, 8, 28, 8, 28).mean(axis=(3, 5)).reshape(len(pixel_values), -1)
+        features = pooled @ self.projection
+        return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "count": int(len(values)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def prepare_fixture(workdir, filenames, dim, seed=0):
+    """为数据中的作品生成合成的向量库和缩略图包"""
+    from embedstore import write_store
+    from thumbpack import build_thumbpack
+
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(len(filenames), dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    write_store(os.path.join(workdir, "embeddings"), [str(i + 1) for i in range(len(filenames))], filenames, embeddings)
+
+    image_dir = os.path.join(workdir, "images")
+    os.makedirs(image_dir, exist_ok=True)
+    for i, filename in enumerate(filenames):
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        Image.new("RGB", (640, 480), color).save(os.path.join(image_dir, os.path.splitext(filename)[0] + ".png"))
+    pngs = {os.path.splitext(f)[0] + ".png": f for f in filenames}
+    build_thumbpack(image_dir, os.path.join(workdir, "thumbs.pack"), filenames=list(pngs))
+    # 缩略图包以图谱中真实的文件名为键
+    index_path = os.path.join(workdir, "thumbs.pack.index.json")
+    with open(index_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["entries"] = {pngs[k]: v for k, v in meta["entries"].items()}
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def run_requests(fn, n, concurrency):
+    """以给定并发执行n次fn(i)，返回(每个请求的耗时dict列表, 总耗时秒数)"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(fn, range(n)))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, wall):
+    stages = {}
+    for timings in results:
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "requests": len(results),
+        "wall_s": wall,
+        "throughput_rps": len(results) / wall if wall > 0 else 0.0,
+        "stages": {stage: percentiles(values) for stage, values in stages.items()},
+    }
+
+
+def bench_image(args, llm, graph, client, images):
+    from pipeline import run_image_pipeline
+
+    def one(i):
+        timings = {}
+        start = time.perf_counter()
+        for _ in run_image_pipeline(
+            images[i % len(images)], IMAGE_PROMPT, llm, graph, client, "gpt-4o-mini",
+            "neo4j://unused", "neo4j", "unused", num=args.num_refs, timings=timings,
+        ):
+            pass
+        timings["total"] = time.perf_counter() - start
+        return timings
+
+    return summarize(*run_requests(one, args.requests, args.concurrency))
+
+
+def bench_text(args, llm, graph, cache):
+    from querygraph import queryGraphStream
+
+    def one(i):
+        marks = [("start", time.perf_counter())]
+        first_token = None
+        for _ in queryGraphStream(llm, graph, QUESTIONS[i % len(QUESTIONS)], 10, cache=cache,
+                                  on_stage=lambda name: marks.append((name, time.perf_counter()))):
+            if first_token is None:
+                first_token = time.perf_counter()
+        end = time.perf_counter()
+        marks.append(("end", end))
+        # 这条链路的阶段依次执行，每个阶段持续到下一个阶段开始
+        timings = {name: marks[j + 1][1] - t for j, (name, t) in enumerate(marks[:-1]) if name != "start"}
+        timings["first_token"] = (first_token or end) - marks[0][1]
+        timings["total"] = end - marks[0][1]
+        return timings
+
+    return summarize(*run_requests(one, args.requests, args.concurrency))
+
+
+def print_report(report, baseline=None):
+    for mode, result in report["results"].items():
+        print(f"\n[{mode}] {result['requests']} 个请求，{result['throughput_rps']:.2f} 请求/秒")
+        base = (baseline or {}).get("results", {}).get(mode, {}).get("stages", {})
+        print(f"  {'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}" + ("   Δp50" if base else ""))
+        for stage, p in result["stages"].items():
+            line = f"  {stage:<14}{p['p50_ms']:>10.1f}{p['p95_ms']:>10.1f}{p['p99_ms']:>10.1f}"
+            if stage in base:
+                line += f"  {p['p50_ms'] - base[stage]['p50_ms']:+7.1f}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用本地替身的离线端到端延迟基准测试")
+    parser.add_argument("--mode", choices=["image", "text", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--num-refs", type=int, default=1, help="每个图片请求检索的相似作品数")
+    parser.add_argument("--images", nargs="+", default=[os.path.join(REPO_ROOT, "test.jpg"), os.path.join(REPO_ROOT, "test1.jpg")])
+    parser.add_argument("--artworks", type=int, default=500, help="载入图谱替身的作品数")
+    parser.add_argument("--ttft", type=float, default=0.3, help="模拟大模型的首token延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="模拟大模型的token间隔（秒）")
+    parser.add_argument("--graph-latency", type=float, default=0.005, help="模拟图谱查询延迟（秒）")
+    parser.add_argument("--encoder", choices=["clip", "fake"], default="clip", help="真实CLIP后端，或固定延迟的替身")
+    parser.add_argument("--encoder-latency", type=float, default=0.05, help="替身编码器每批延迟（秒）")
+    parser.add_argument("--clip-backend", default="torch", help="--encoder clip时使用的CLIP_BACKEND")
+    parser.add_argument("--cold", action="store_true", help="关闭上传图片的向量缓存")
+    parser.add_argument("--cypher-cache", action="store_true", help="纯文本链路使用问题->Cypher缓存")
+    parser.add_argument("--output-dir", default=os.path.join(BENCH_DIR, "results"))
+    parser.add_argument("--compare", help="用于对比的历史结果JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="gallery-bench-")
+    # 模块级配置在导入时读取，需要在导入应用模块之前设置
+    os.environ.update({
+        "SIMILARITY_BACKEND": "exact",
+        "EMBEDDING_STORE": os.path.join(workdir, "embeddings"),
+        "THUMBPACK_PATH": os.path.join(workdir, "thumbs.pack"),
+        "EMBEDDING_CACHE_DIR": os.path.join(workdir, "cache"),
+        "EMBEDDING_CACHE": "0" if args.cold else "1",
+        "CLIP_BACKEND": args.clip_backend,
+    })
+    sys.path.insert(0, BENCH_DIR)
+    from fake_graph import InMemoryGraph
+    from fake_openai import FakeChatServer
+    from langchain_openai import ChatOpenAI
+    from openai import OpenAI
+    from cyphercache import CypherCache
+
+    graph = InMemoryGraph(max_artworks=args.artworks, latency=args.graph_latency)
+    if args.mode in ("image", "both"):
+        import embedding
+        from resources import get_resource
+
+        if args.encoder == "fake":
+            get_resource(f"clip_encoder:{embedding.CLIP_BACKEND}", lambda: FakeEncoder(latency=args.encoder_latency))
+        encoder = embedding.load_encoder()
+        prepare_fixture(workdir, graph.filenames, encoder.dim)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "results": {},
+    }
+    with FakeChatServer(ttft=args.ttft, token_delay=args.token_delay) as server:
+        llm = ChatOpenAI(model="deepseek-chat", api_key="bench", base_url=server.base_url, streaming=True)
+        client = OpenAI(api_key="bench", base_url=server.base_url)
+        if args.mode in ("image", "both"):
+            report["results"]["image"] = bench_image(args, llm, graph, client, args.images)
+        if args.mode in ("text", "both"):
+            cache = CypherCache() if args.cypher_cache else None
+            report["results"]["text"] = bench_text(args, llm, graph, cache)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n结果已保存到 {path}")
+
+
+if __name__ == "__main__":
+    main()
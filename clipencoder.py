@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+
+# CLIP图片编码器的可选后端，启动时通过环境变量CLIP_BACKEND选择：
+#   torch     原始float32模型（默认）
+#   int8      对Linear层做动态INT8量化的torch模型
+#   onnx      导出的ONNX图，由ONNX Runtime在CPU上执行
+#   onnx-int8 动态INT8量化后的ONNX图
+# 所有后端的encode都返回L2归一化后的float32向量，可直接与已有embedding比较
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+MODEL_NAME = "openai/clip-vit-base-patch32"
+ONNX_PATH = os.getenv("CLIP_ONNX_PATH", "models/clip_image.onnx")
+
+
+def resolve_model_path(model_path=None):
+    """优先使用指定目录/CLIP_MODEL_PATH，其次是huggingface本地缓存，最后回退到在线下载"""
+    model_path = model_path or os.getenv("CLIP_MODEL_PATH")
+    if model_path:
+        return model_path
+    try:
+        from huggingface_hub import snapshot_download
+        return snapshot_download(MODEL_NAME, local_files_only=True)
+    except Exception:
+        return MODEL_NAME
+
+
+def _normalize(x):
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+class CLIPEncoder:
+    """各后端共用的预处理：PIL图片 -> (N, 3, 224, 224) float32"""
+
+    name = None
+
+    def __init__(self, model_path=None):
+        from transformers import CLIPImageProcessor
+
+        self.model_path = resolve_model_path(model_path)
+        self.image_processor = CLIPImageProcessor.from_pretrained(self.model_path)
+
+    def preprocess(self, images):
+        return self.image_processor(images=images, return_tensors="np")["pixel_values"].astype(np.float32)
+
+    def encode(self, pixel_values):
+        raise NotImplementedError
+
+    def encode_images(self, images):
+        return self.encode(self.preprocess(images))
+
+
+class TorchCLIPEncoder(CLIPEncoder):
+    def __init__(self, model_path=None, quantize=False, device="cpu"):
+        super().__init__(model_path)
+        import torch
+        from transformers import CLIPModel
+
+        self.name = "int8" if quantize else "torch"
+        self.device = device
+        # safetensors权重通过mmap加载，low_cpu_mem_usage避免先随机初始化再拷贝权重
+        model = CLIPModel.from_pretrained(self.model_path, low_cpu_mem_usage=True)
+        model.to(device)
+        model.eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.dim = model.config.projection_dim
+
+    def encode(self, pixel_values):
+        import torch
+
+        with torch.no_grad():
+            features = self.model.get_image_features(pixel_values=torch.from_numpy(pixel_values).to(self.device))
+        return _normalize(features.cpu().numpy().astype(np.float32))
+
+
+def export_onnx(model_path=None, onnx_path=ONNX_PATH, quantize=False):
+    """把CLIP视觉塔+投影层（含归一化）导出为ONNX，quantize=True时额外生成动态INT8量化版本"""
+    import torch
+    from transformers import CLIPModel
+
+    class ImageFeatures(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            features = self.model.get_image_features(pixel_values=pixel_values)
+            return features / features.norm(p=2, dim=-1, keepdim=True)
+
+    model = CLIPModel.from_pretrained(resolve_model_path(model_path))
+    model.eval()
+    os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+    torch.onnx.export(
+        ImageFeatures(model),
+        torch.zeros(1, 3, 224, 224),
+        onnx_path,
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset_version=17,
+    )
+    print(f"已导出ONNX模型: {onnx_path}")
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(onnx_path, _int8_path(onnx_path), weight_type=QuantType.QInt8)
+        print(f"已导出INT8量化ONNX模型: {_int8_path(onnx_path)}")
+
+
+def _int8_path(onnx_path):
+    root, ext = os.path.splitext(onnx_path)
+    return f"{root}.int8{ext}"
+
+
+class OnnxCLIPEncoder(CLIPEncoder):
+    def __init__(self, model_path=None, onnx_path=ONNX_PATH, quantize=False, num_threads=None):
+        super().__init__(model_path)
+        import onnxruntime as ort
+
+        self.name = "onnx-int8" if quantize else "onnx"
+        path = _int8_path(onnx_path) if quantize else onnx_path
+        if not os.path.exists(path):
+            # 首次使用时导出（需要torch），之后只依赖onnxruntime
+            export_onnx(model_path, onnx_path, quantize=quantize)
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.dim = self.session.get_outputs()[0].shape[1]
+
+    def encode(self, pixel_values):
+        (features,) = self.session.run(["image_embeds"], {"pixel_values": pixel_values})
+        return _normalize(features.astype(np.float32))
+
+
+def create_encoder(backend=None, model_path=None, device="cpu"):
+    """按后端名创建编码器，backend为None时读取环境变量CLIP_BACKEND；device只对torch后端生效"""
+    backend = backend or os.getenv("CLIP_BACKEND", "torch")
+    if backend == "torch":
+        return TorchCLIPEncoder(model_path, device=device)
+    if backend == "int8":
+        # 动态量化只支持CPU
+        return TorchCLIPEncoder(model_path, quantize=True)
+    if backend == "onnx":
+        return OnnxCLIPEncoder(model_path)
+    if backend == "onnx-int8":
+        return OnnxCLIPEncoder(model_path, quantize=True)
+    raise ValueError(f"未知的CLIP后端: {backend}，可选 {list(BACKENDS)}")
@@ -0,0 +1,145 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_question(question):
+    """统一大小写、去掉标点、合并空白，作为缓存的精确匹配键"""
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+
+def cache_key(question, scope=""):
+    """scope区分图谱schema、top_k等：同一个问题在不同作用域下是不同的条目"""
+    question = normalize_question(question)
+    return f"{scope}\n{question}" if scope else question
+
+
+class CypherCache:
+    """
+    问题 -> 已验证Cypher（可选：最终回答）的缓存。
+    默认只按归一化问题精确匹配：字符级的相似度分不清"Very Good"和"Very Poor"、"5件"和"3件"，
+    近似命中会复用语义相反的Cypher。需要近似匹配时传入真正的语义向量embed_fn和threshold，
+    threshold要用这类反例校验过（相反的问题必须未命中）。
+    条目按scope（调用方给出的图谱schema、top_k等标识）隔离，只在同一scope内匹配。
+    LRU + TTL淘汰，可持久化到磁盘JSON文件。
+
+    参数：
+        path: 持久化文件路径，None表示只在内存中缓存
+        threshold: 近似匹配的最低余弦相似度，None表示只精确匹配
+        max_entries: 最多保留的条目数，超过后淘汰最久未使用的
+        ttl: 条目有效期（秒）
+        embed_fn: 问题文本 -> 归一化的语义向量，近似匹配时必须提供
+        cache_answers: 是否同时缓存最终回答（命中时完全跳过大模型）
+    """
+
+    def __init__(self, path=None, threshold=None, max_entries=512, ttl=7 * 24 * 3600,
+                 embed_fn=None, cache_answers=False):
+        if threshold is not None and embed_fn is None:
+            raise ValueError("近似匹配需要提供语义向量embed_fn")
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_fn = embed_fn if threshold is not None else None
+        self.cache_answers = cache_answers
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # cache_key -> 条目
+        self._vectors = {}             # cache_key -> 问题的向量
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["created"] > self.ttl
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        self._vectors.pop(key, None)
+
+    def _embed(self, entry):
+        return self.embed_fn(normalize_question(entry["question"]))
+
+    def lookup(self, question, scope=""):
+        """返回命中的条目（含cypher，可能含answer），未命中返回None"""
+        key = cache_key(question, scope)
+        now = time.time()
+        with self._lock:
+            for k in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                self._remove(k)
+            match = key if key in self._entries else None
+            keys = []
+            if match is None and self.embed_fn is not None:
+                keys = [k for k in self._vectors if self._entries[k].get("scope", "") == scope]
+            if keys:
+                scores = np.stack([self._vectors[k] for k in keys]) @ self.embed_fn(normalize_question(question))
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    match = keys[best]
+            if match is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(match)
+            return dict(self._entries[match])
+
+    def store(self, question, cypher, answer=None, scope=""):
+        """保存已验证（执行成功且有结果）的Cypher"""
+        key = cache_key(question, scope)
+        with self._lock:
+            self._entries[key] = {
+                "question": question,
+                "scope": scope,
+                "cypher": cypher,
+                "answer": answer if self.cache_answers else None,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            if self.embed_fn is not None:
+                self._vectors[key] = self._embed(self._entries[key])
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        self.save()
+
+    def invalidate(self, question, scope=""):
+        with self._lock:
+            self._remove(cache_key(question, scope))
+        self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = list(self._entries.items())
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # 先写临时文件再原子替换，避免中途崩溃留下损坏的缓存文件
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        now = time.time()
+        with self._lock:
+            for key, entry in data:
+                if not self._expired(entry, now):
+                    self._entries[key] = entry
+                    if self.embed_fn is not None:
+                        self._vectors[key] = self._embed(entry)
@@ -1,16 +1,59 @@
+import io
+import os
+import threading
+import numpy as np
 from PIL import Image
-import torch
-from transformers import CLIPProcessor, CLIPModel
 from langchain_neo4j import Neo4jVector
 from langchain.embeddings.base import Embeddings
+from filecache import FileCache
+from resources import get_resource
+from tracing import inc, record_cache, span
 
-# 加载模型
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-    
-device = "cpu"
-model.to(device)
-model.eval()  
+# CLIP模型在首次使用时才加载（torch/transformers也随之延迟导入），纯文本问答不需要付出这部分开销
+# 编码后端见clipencoder.py，通过环境变量CLIP_BACKEND选择（torch/int8/onnx/onnx-int8）
+MODEL_NAME = "openai/clip-vit-base-patch32"
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch")
+
+# 相似度检索后端：neo4j（图数据库向量索引）、exact（进程内精确检索）、ivf（进程内近似检索）
+SIMILARITY_BACKEND = os.getenv("SIMILARITY_BACKEND", "neo4j")
+EMBEDDING_STORE = os.getenv("EMBEDDING_STORE", "embeddings")
+
+def load_encoder():
+    """返回进程内共享的CLIP图片编码器"""
+    from clipencoder import create_encoder
+    return get_resource(f"clip_encoder:{CLIP_BACKEND}", lambda: create_encoder(CLIP_BACKEND))
+
+# 多个会话并发上传时，通过共享的动态批处理服务合并前向计算（EMBEDDING_BATCHING=0 关闭）
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "1") == "1"
+
+def get_batcher():
+    """返回进程内共享的动态批处理编码服务"""
+    def create():
+        from batcher import EmbeddingBatcher
+        return EmbeddingBatcher(
+            load_encoder().encode,
+            max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH", "16")),
+            max_wait_ms=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "10")),
+        )
+    return get_resource("embedding_batcher", create)
+
+def batcher_metrics():
+    from resources import is_loaded
+    return get_batcher().metrics() if is_loaded("embedding_batcher") else {}
+
+def warmup():
+    """加载CLIP并执行一次前向计算，避免首个请求承担初始化开销"""
+    load_encoder().encode(np.zeros((1, 3, 224, 224), dtype=np.float32))
+
+# 按图片内容哈希缓存归一化后的embedding，重复上传/Streamlit重跑时不再调用模型（EMBEDDING_CACHE=0 关闭）
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") == "1"
+
+def get_embedding_cache():
+    return get_resource("embedding_cache", lambda: FileCache(
+        os.getenv("EMBEDDING_CACHE_DIR", "cache/embeddings"),
+        max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_MB", "256")) * 2**20,
+        suffix=".f32",
+    ))
 
 # 为clip定义嵌入类便于进行图谱查询
 class CLIPEmbeddings(Embeddings):
@@ -32,52 +75,235 @@ class CLIPEmbeddings(Embeddings):
         return [self.embed_query(v) for v in vectors]
 
 def process_embbeding(img_path):
-    try:
-        image = Image.open(img_path).convert("RGB") 
-        
-        # 预处理图片（归一化、resize等）
-        inputs = processor(images=image, return_tensors="pt").to(device)
-        
-        # 生成嵌入向量（CLIP的图片编码器输出）
-        with torch.no_grad():  # 关闭梯度计算，加速推理
-            img_embedding = model.get_image_features(**inputs)
-        
-        # 归一化向量（可选，通常推荐）
-        img_embedding = img_embedding / img_embedding.norm(p=2, dim=1, keepdim=True)
-        
-        # 转换为Python列表，便于存储
-        emb=img_embedding.cpu().numpy().flatten().tolist()
-        print(f"成功处理图片: {img_path}")
-
-    except Exception as e:
-        print(f"处理图片失败 {img_path}: {str(e)}")
-        emb=None 
+    with span("embed", backend=CLIP_BACKEND) as sp:
+        try:
+            with open(img_path, "rb") as f:
+                data = f.read()
+            sp.set(bytes=len(data))
+            # 不同后端的向量略有差异，缓存键包含后端名
+            key = FileCache.key_for(MODEL_NAME, CLIP_BACKEND, data)
+            embedding_cache = get_embedding_cache() if EMBEDDING_CACHE else None
+            cached = embedding_cache.get(key) if embedding_cache is not None else None
+            if embedding_cache is not None:
+                record_cache("embedding", cached is not None)
+                sp.set(cache_hit=cached is not None)
+            if cached is not None:
+                return np.frombuffer(cached, dtype=np.float32).tolist()
+
+            encoder = load_encoder()
+            image = Image.open(io.BytesIO(data)).convert("RGB") 
+            
+            # 预处理图片（归一化、resize等），生成归一化后的嵌入向量（CLIP的图片编码器输出）
+            pixel_values = encoder.preprocess([image])
+            if EMBEDDING_BATCHING:
+                img_embedding = get_batcher().encode(pixel_values[0])[None, :]
+            else:
+                img_embedding = encoder.encode(pixel_values)
+            
+            # 转换为Python列表，便于存储
+            emb=img_embedding.flatten().tolist()
+            if embedding_cache is not None:
+                embedding_cache.put(key, img_embedding.astype(np.float32).tobytes())
+            print(f"成功处理图片: {img_path}")
+
+        except Exception as e:
+            print(f"处理图片失败 {img_path}: {str(e)}")
+            sp.record_error(e)
+            emb=None 
     return emb
 
-def get_similar_file(url,username,password,emb,num=2):
-    # 从已有节点表中初始化 vector store
-    clip_embedding = CLIPEmbeddings(model=None)
-    vectorestore = Neo4jVector.from_existing_graph(
-        embedding=clip_embedding,
-        url=url,
-        username=username,
-        password=password,
-        node_label="Artwork",
-        embedding_node_property="embedding",
-        text_node_properties=["filename"]
-    )
-
-    # 相似度检索
-    similar_docs = vectorestore.similarity_search_by_vector(emb, k=num,query="")
-
-    filenames=[]
-    for doc in similar_docs:
-        filename = doc.page_content.strip().split('filename:')[1].strip()
-        if filename: 
-            # print(filename)
-            filenames.append(filename)
+# 批量编码多张图片（批量评论等离线场景）：先查embedding缓存，未命中的图片按batch_size分批送入编码器
+def embed_images(img_paths, batch_size=32):
+    """返回(N, dim) float32矩阵和(N,)布尔数组ok；读取或解码失败的图片ok为False，对应行全为0"""
+    embedding_cache = get_embedding_cache() if EMBEDDING_CACHE else None
+    vectors = [None] * len(img_paths)
+    misses = []
+    hits = 0
+    with span("embed_batch", backend=CLIP_BACKEND, images=len(img_paths)) as sp:
+        for i, path in enumerate(img_paths):
+            try:
+                with open(path, "rb") as f:
+                    key = FileCache.key_for(MODEL_NAME, CLIP_BACKEND, f.read())
+            except OSError as e:
+                print(f"处理图片失败 {path}: {str(e)}")
+                continue
+            cached = embedding_cache.get(key) if embedding_cache is not None else None
+            if embedding_cache is not None:
+                record_cache("embedding", cached is not None)
+            if cached is not None:
+                vectors[i] = np.frombuffer(cached, dtype=np.float32)
+                hits += 1
+            else:
+                # 只记下路径，编码时再读取，避免整批图片同时驻留内存
+                misses.append((i, key))
+
+        encoder = load_encoder() if misses else None
+        for start in range(0, len(misses), batch_size):
+            images, rows = [], []
+            for i, key in misses[start:start + batch_size]:
+                try:
+                    images.append(Image.open(img_paths[i]).convert("RGB"))
+                    rows.append((i, key))
+                except Exception as e:
+                    print(f"处理图片失败 {img_paths[i]}: {str(e)}")
+            if not images:
+                continue
+            batch = encoder.encode(encoder.preprocess(images)).astype(np.float32)
+            for (i, key), vector in zip(rows, batch):
+                vectors[i] = vector
+                if embedding_cache is not None:
+                    embedding_cache.put(key, vector.tobytes())
+        sp.set(cache_hits=hits, encoded=len(misses))
+
+    ok = np.array([v is not None for v in vectors], dtype=bool)
+    dim = len(next((v for v in vectors if v is not None), ()))
+    matrix = np.zeros((len(img_paths), dim), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if vector is not None:
+            matrix[i] = vector
+    return matrix, ok
+
+# 进程内共享的neo4j向量检索器：持有带连接池的driver和已解析的向量索引名，
+# 避免每次请求都重新建立连接、探测索引
+class Neo4jRetriever:
+    def __init__(self, url, username, password, node_label="Artwork",
+                 embedding_node_property="embedding", text_node_property="filename",
+                 max_connection_pool_size=50):
+        self.url = url
+        self.auth = (username, password)
+        self.node_label = node_label
+        self.embedding_node_property = embedding_node_property
+        self.text_node_property = text_node_property
+        self.max_connection_pool_size = max_connection_pool_size
+        self._lock = threading.Lock()
+        self.driver = None
+        self.index_name = None
+        self.connect()
+
+    def connect(self, stale_driver=None):
+        """建立driver并解析向量索引名（索引不存在时沿用Neo4jVector的逻辑创建）。
+        传入stale_driver时，仅当它仍是当前driver才重连，避免多个线程重复重连"""
+        from neo4j import GraphDatabase
+
+        with self._lock:
+            if stale_driver is not None and self.driver is not stale_driver:
+                return
+            if self.driver is not None:
+                self.driver.close()
+            self.driver = GraphDatabase.driver(
+                self.url,
+                auth=self.auth,
+                max_connection_pool_size=self.max_connection_pool_size,
+                liveness_check_timeout=30,
+            )
+            self.driver.verify_connectivity()
+            self.index_name = self._resolve_index()
+            if self.index_name is None:
+                Neo4jVector.from_existing_graph(
+                    embedding=CLIPEmbeddings(model=None),
+                    url=self.url,
+                    username=self.auth[0],
+                    password=self.auth[1],
+                    node_label=self.node_label,
+                    embedding_node_property=self.embedding_node_property,
+                    text_node_properties=[self.text_node_property],
+                )
+                self.index_name = self._resolve_index()
+            if self.index_name is None:
+                raise ValueError(f"未找到 {self.node_label}.{self.embedding_node_property} 上的向量索引")
+
+    def _resolve_index(self):
+        records, _, _ = self.driver.execute_query(
+            "SHOW INDEXES YIELD name, type, labelsOrTypes, properties "
+            "WHERE type = 'VECTOR' AND $label IN labelsOrTypes AND $prop IN properties "
+            "RETURN name",
+            label=self.node_label,
+            prop=self.embedding_node_property,
+        )
+        return records[0]["name"] if records else None
+
+    def health_check(self):
+        """检查连接是否可用"""
+        try:
+            self.driver.verify_connectivity()
+            return True
+        except Exception:
+            return False
+
+    def search(self, emb, k=2):
+        """按向量检索最相似的k个作品，返回文件名列表；连接失效时自动重连一次"""
+        query = (
+            "CALL db.index.vector.queryNodes($index, $k, $embedding) YIELD node, score "
+            f"RETURN node.`{self.text_node_property}` AS filename ORDER BY score DESC"
+        )
+        records = self._execute(query, {"k": k, "embedding": [float(x) for x in emb]})
+        return [r["filename"].strip() for r in records if r["filename"]]
+
+    def search_batch(self, embs, k=2):
+        """一次往返检索多个向量，返回与embs等长的文件名列表的列表"""
+        query = (
+            "UNWIND range(0, size($embeddings) - 1) AS i "
+            "CALL db.index.vector.queryNodes($index, $k, $embeddings[i]) YIELD node, score "
+            f"RETURN i, node.`{self.text_node_property}` AS filename ORDER BY i, score DESC"
+        )
+        results = [[] for _ in range(len(embs))]
+        if not results:
+            return results
+        records = self._execute(query, {"k": k, "embeddings": [[float(x) for x in emb] for emb in embs]})
+        for r in records:
+            if r["filename"]:
+                results[r["i"]].append(r["filename"].strip())
+        return results
+
+    def _execute(self, query, params):
+        """执行查询，连接失效时自动重连一次"""
+        from neo4j.exceptions import ServiceUnavailable, SessionExpired
+
+        driver = self.driver
+        try:
+            records, _, _ = driver.execute_query(query, {"index": self.index_name, **params})
+        except (ServiceUnavailable, SessionExpired):
+            inc("gallery_neo4j_reconnects_total")
+            self.connect(stale_driver=driver)
+            records, _, _ = self.driver.execute_query(query, {"index": self.index_name, **params})
+        return records
+
+    def close(self):
+        with self._lock:
+            if self.driver is not None:
+                self.driver.close()
+                self.driver = None
+
+
+def get_retriever(url, username, password):
+    """每个进程按连接信息只创建一个检索器，供所有会话和线程共享"""
+    return get_resource(f"neo4j_retriever:{url}:{username}", lambda: Neo4jRetriever(url, username, password))
+
+def get_similar_file(url,username,password,emb,num=2,backend=None):
+    backend = backend or SIMILARITY_BACKEND
+    with span("vector_search", backend=backend, k=num) as sp:
+        if backend != "neo4j":
+            # 进程内检索，直接基于本地向量存储，返回同样的文件名列表
+            from vectorsearch import get_index
+            filenames = get_index(EMBEDDING_STORE, backend).search(emb, k=num)
+        else:
+            # 复用进程内的检索器，只付出相似度查询本身的耗时
+            filenames = get_retriever(url, username, password).search(emb, k=num)
+        sp.set(results=len(filenames))
     return filenames
 
+def get_similar_files(url,username,password,embs,num=2,backend=None):
+    """批量相似检索：embs为(N, dim)矩阵，返回N个文件名列表；进程内后端一次矩阵运算完成，neo4j一次往返"""
+    backend = backend or SIMILARITY_BACKEND
+    embs = np.asarray(embs, dtype=np.float32)
+    with span("vector_search_batch", backend=backend, k=num, queries=len(embs)):
+        if len(embs) == 0:
+            return []
+        if backend != "neo4j":
+            from vectorsearch import get_index
+            return get_index(EMBEDDING_STORE, backend).search_batch(embs, k=num)
+        return get_retriever(url, username, password).search_batch(embs, k=num)
+
 if __name__=='__main__':
     url="neo4j://localhost:7687"
     username="neo4j"
@@ -0,0 +1,165 @@
+import json
+import os
+
+import numpy as np
+
+# 向量存储目录结构：
+#   embeddings.npy  (N, dim) float32/float16 矩阵，可用mmap零拷贝加载
+#   valid.npy       (N,) bool，标记该行是否成功生成了embedding
+#   index.json      {"ids": [...], "filenames": [...]}，与矩阵行一一对应
+#   meta.json       维度、精度、数量等信息
+MATRIX_FILE = "embeddings.npy"
+VALID_FILE = "valid.npy"
+INDEX_FILE = "index.json"
+META_FILE = "meta.json"
+
+
+class EmbeddingStore:
+    """只读的二进制向量存储，默认以mmap方式打开，加载耗时与数据量无关"""
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        mode = "r" if mmap else None
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, INDEX_FILE), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.ids = index["ids"]
+        self.filenames = index["filenames"]
+        self.matrix = np.load(os.path.join(path, MATRIX_FILE), mmap_mode=mode)
+        self.valid = np.load(os.path.join(path, VALID_FILE), mmap_mode=mode)
+        self._rows = {name: i for i, name in enumerate(self.filenames)}
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def get(self, filename):
+        """按文件名取出单个向量（float32），不存在或生成失败时返回None"""
+        row = self._rows.get(filename)
+        if row is None or not self.valid[row]:
+            return None
+        return np.asarray(self.matrix[row], dtype=np.float32)
+
+
+class EmbeddingStoreWriter:
+    """
+    增量写入向量存储，适合批量生成embedding时边算边写。
+    index/meta在创建时写出，valid在每批写入后更新，进程中途退出时存储仍可打开，
+    已写入的行有效、其余行标记为无效
+    """
+
+    def __init__(self, path, ids, filenames, dim=512, dtype="float32"):
+        if len(ids) != len(filenames):
+            raise ValueError("ids与filenames长度必须一致")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.ids = [str(i) for i in ids]
+        self.filenames = [str(f) for f in filenames]
+        self.dtype = np.dtype(dtype)
+        self.matrix = np.lib.format.open_memmap(
+            os.path.join(path, MATRIX_FILE), mode="w+", dtype=self.dtype, shape=(len(filenames), dim)
+        )
+        self.valid = np.zeros(len(filenames), dtype=bool)
+        with open(os.path.join(path, INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "filenames": self.filenames}, f)
+        self._save_state()
+
+    def write(self, start, embeddings, valid=None):
+        """从第start行开始写入一批向量，valid标记每一行是否有效"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        stop = start + len(embeddings)
+        self.matrix[start:stop] = embeddings.astype(self.dtype)
+        self.valid[start:stop] = True if valid is None else valid
+        # 先落盘向量再标记有效，valid中为True的行一定已写入
+        self.matrix.flush()
+        self._save_state()
+
+    def _save_state(self):
+        """原子替换valid.npy和meta.json"""
+        tmp = os.path.join(self.path, VALID_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, self.valid)
+        os.replace(tmp, os.path.join(self.path, VALID_FILE))
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "count": len(self.filenames),
+                "dim": int(self.matrix.shape[1]),
+                "dtype": self.dtype.name,
+                "valid": int(self.valid.sum()),
+            }, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def close(self):
+        if self.matrix is None:
+            return
+        self.matrix.flush()
+        self._save_state()
+        self.matrix = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_store(path, ids, filenames, embeddings, valid=None, dtype="float32"):
+    """一次性写入完整的向量矩阵"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    with EmbeddingStoreWriter(path, ids, filenames, dim=embeddings.shape[1], dtype=dtype) as writer:
+        writer.write(0, embeddings, valid)
+
+
+def store_from_csv(csv_path, store_path, dtype="float32"):
+    """把旧格式（embedding列为字符串列表）的Artwork.csv转换为二进制向量存储"""
+    import pandas as pd
+
+    df = pd.read_csv(csv_path, dtype={"id": str})
+    parsed = [json.loads(e) if isinstance(e, str) and e.strip() else None for e in df["embedding"]]
+    dim = next((len(e) for e in parsed if e is not None), 512)
+    valid = np.array([e is not None for e in parsed], dtype=bool)
+    embeddings = np.array([e if e is not None else [0.0] * dim for e in parsed], dtype=np.float32)
+    write_store(store_path, df["id"].tolist(), df["filename"].tolist(), embeddings, valid, dtype)
+    print(f"已转换 {int(valid.sum())}/{len(df)} 条embedding到: {store_path}")
+
+
+def export_neo4j_csv(store_path, output_csv_path, label="Artwork"):
+    """按需从向量存储导出neo4j导入用的Artwork.csv（id,filename,embedding,:LABEL）"""
+    import csv
+
+    store = EmbeddingStore(store_path)
+    with open(output_csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "filename", "embedding", ":LABEL"])
+        for i, (artwork_id, filename) in enumerate(zip(store.ids, store.filenames)):
+            if store.valid[i]:
+                emb = json.dumps(np.asarray(store.matrix[i], dtype=np.float32).tolist())
+            else:
+                emb = ""
+            writer.writerow([artwork_id, filename, emb, label])
+    print(f"已导出 {len(store)} 条记录到: {output_csv_path}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="二进制向量存储工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="从带embedding列的Artwork.csv生成向量存储")
+    p_import.add_argument("csv")
+    p_import.add_argument("store")
+    p_import.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    p_export = sub.add_parser("export", help="从向量存储导出neo4j导入用的Artwork.csv")
+    p_export.add_argument("store")
+    p_export.add_argument("csv")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        store_from_csv(args.csv, args.store, args.dtype)
+    else:
+        export_neo4j_csv(args.store, args.csv)
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import threading
+
+
+class FileCache:
+    """
+    内容寻址的磁盘缓存：key -> bytes。
+    每个条目一个文件（按key前两位分目录），写入时先写临时文件再os.replace原子替换，
+    读者永远看不到半个文件，因此多个进程/线程可以同时读写同一目录；
+    总大小超过max_bytes时按最近访问时间（mtime）淘汰最旧的条目。
+
+    内存中的总大小只统计本进程的写入，其他进程共享同一目录时会偏小：
+    本进程累计写入超过上限的rescan_fraction后重新扫描目录校准，超限时以扫描结果为准淘汰。
+    """
+
+    def __init__(self, directory, max_bytes=256 * 2**20, suffix=".bin", rescan_fraction=0.05):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.rescan_bytes = max_bytes * rescan_fraction
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._scan())
+        self._written = 0  # 上次扫描之后本进程写入的字节数
+
+    @staticmethod
+    def key_for(*parts):
+        """由若干str/bytes拼出稳定的sha256键"""
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            h.update(len(part).to_bytes(8, "little"))
+            h.update(part)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # 更新mtime，作为LRU淘汰的依据
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        try:
+            # 覆盖已有条目时只增加差值
+            old_size = os.stat(path).st_size
+        except FileNotFoundError:
+            old_size = 0
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data) - old_size
+            self._written += len(data)
+            sync = self._size > self.max_bytes or self._written >= self.rescan_bytes
+        if sync:
+            self.sync()
+
+    def sync(self):
+        """重新扫描目录校准总大小（包括其他进程的写入），超过上限时淘汰"""
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            self.evict(entries)
+            return
+        with self._lock:
+            self._size = total
+            self._written = 0
+
+    def _scan(self):
+        """返回所有条目的(path, size, mtime)"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def evict(self, entries=None):
+        """淘汰最久未访问的条目，直到总大小降到上限的90%以下；entries为_scan()的结果，默认重新扫描"""
+        entries = sorted(self._scan() if entries is None else entries, key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # 其他进程已经删除
+                pass
+            total -= size
+        with self._lock:
+            self._size = total
+            self._written = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "bytes": self._size,
+            }
@@ -1,3 +1,4 @@
+from resources import get_resource, mark, startup_report
 from htbuilder.units import rem
 from htbuilder import div, styles
 import uuid
@@ -5,58 +6,41 @@ import os
 from dotenv import load_dotenv 
 
 import streamlit as st
-from openai import OpenAI
-from langchain_openai import ChatOpenAI
-from langchain_neo4j import Neo4jGraph
 from PIL import Image
-from embedding import process_embbeding,get_similar_file
-from querygraph import queryGraph,queryImage
-from vllm import call_vllm
-
-# 配置neo4j
-url="neo4j://localhost:7687"
-username="neo4j"
-password="apropos-sphere-violin-texas-strong-2496"
-graph = Neo4jGraph(
-    url=url,  
-    username=username,       
-    password=password,
-    # enhanced_schema=True,
-)
+from galleryclient import GALLERY_API_URL, GalleryAPIError, GalleryClient
+
+mark("imports")
 
-# 模型配置, 加载 API Key
+# 界面只是 server.py 的客户端：模型和数据库连接都在服务进程中加载，这里只转发请求、显示流式回答
 load_dotenv()
 
-deepseek_llm = ChatOpenAI(
-    model_name="deepseek-chat", 
-    openai_api_key=os.getenv("DEEPSEEK_API_KEY"),  
-    openai_api_base="https://api.deepseek.com/v1", 
-    streaming=True
-)
-
-openai_client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),  
-    base_url='https://openai.api2d.net/v1'
-)
-GPT_MODEL = "gpt-4o-mini" 
+def get_client():
+    return get_resource("gallery_client", lambda: GalleryClient(os.getenv("GALLERY_API_URL", GALLERY_API_URL)))
 
 # 标签页名
 st.set_page_config(page_title="Gallery AI", page_icon="🌼")
 
-# 纯文本问答，调用图谱QA
-def get_response_languageOnly(prompt):
-    return queryGraph(deepseek_llm,graph,prompt,10)
-
-# 多模态问答，查找相似图片+图谱QA+调用多模态模型 
-def get_response_forImage(image_path,prompt):
-    # clip编码
-    emb=process_embbeding(image_path)
-    # 查找图谱类似图片
-    filenames=get_similar_file(url,username,password,emb,num=1)
-    # 在图谱内搜集他们的信息
-    kg=queryImage(deepseek_llm,graph,top_k=20,image_filenames=filenames)
-    # 调用多模态大模型分析
-    return call_vllm(openai_client,GPT_MODEL,kg,prompt,image_path,filenames)
+# 各阶段在界面上显示的进度文字
+STAGE_LABELS = {
+    "cypher": "Generating Cypher...",
+    "query": "Querying knowledge graph...",
+    "answer": "Writing answer...",
+    "embed": "Encoding image...",
+    "encode_target": "Encoding image...",
+    "search": "Searching similar artworks...",
+    "kg": "Collecting reference evaluations...",
+    "encode_refs": "Preparing reference images...",
+    "encode": "Preparing images...",
+    "generate": "Analyzing artwork...",
+}
+
+# 纯文本问答（流式产出回答）
+def get_response_languageOnly(prompt,on_stage=None):
+    return get_client().ask(prompt, on_stage=on_stage)
+
+# 多模态问答，上传图片由服务端完成检索、图谱查询和多模态模型调用（流式产出回答）
+def get_response_forImage(image_path,prompt,on_stage=None):
+    return get_client().critique(image_path, prompt, on_stage=on_stage)
 
 def save_uploaded_image(uploaded_file):
     """保存上传的图片到本地，返回唯一文件路径"""
@@ -185,22 +169,40 @@ with col2:
 
         # 显示助手回复
         with st.chat_message("assistant"):
-            with st.spinner("Waiting..."):
-                if "image_path" in user_msg:
-                    # 🔥 多模态问答
-                    response = get_response_forImage(
-                        image_path=user_msg["image_path"], 
-                        prompt=user_message
-                    )
-                else:
-                    # 文本问答
-                    response = get_response_languageOnly(user_message)
-
-                st.markdown(response)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response
-                })
+            # 阶段进度，回答逐token流式显示
+            status = st.status("Waiting...", expanded=False)
+
+            def on_stage(name):
+                status.update(label=STAGE_LABELS.get(name, name), state="running")
+
+            # 关联ID、各阶段的span和指标都在服务端记录
+            if "image_path" in user_msg:
+                # 🔥 多模态问答
+                stream = get_response_forImage(
+                    image_path=user_msg["image_path"], 
+                    prompt=user_message,
+                    on_stage=on_stage,
+                )
+            else:
+                # 文本问答
+                stream = get_response_languageOnly(user_message, on_stage=on_stage)
+
+            try:
+                response = st.write_stream(stream)
+                status.update(label="Done", state="complete")
+            except GalleryAPIError as e:
+                # 服务繁忙（503）或回答出错
+                response = f"Sorry, something went wrong: {e}"
+                st.error(response)
+                status.update(label="Failed", state="error")
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": response
+            })
                 
         # ✅ 清空图片缓存（用户发送后立即清空上传区）
-        clear_uploaded_image()
\ No newline at end of file
+        clear_uploaded_image()
+
+# 首次渲染完成后输出一次启动耗时报告
+if mark("first_render"):
+    print(startup_report())
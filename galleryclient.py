@@ -0,0 +1,83 @@
+import base64
+import json
+import os
+import urllib.error
+import urllib.request
+
+# server.py 的HTTP客户端（只依赖标准库）：逐行读取NDJSON事件，阶段回调on_stage，回答逐段产出
+
+GALLERY_API_URL = os.getenv("GALLERY_API_URL", "http://localhost:8000")
+
+
+class GalleryAPIError(Exception):
+    """服务返回错误，或回答过程中出错"""
+
+
+class ServerBusy(GalleryAPIError):
+    """服务的工作线程和排队都已满（503），稍后重试"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GalleryClient:
+    def __init__(self, base_url=GALLERY_API_URL, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def ask(self, prompt, on_stage=None):
+        """纯文本问答，返回回答片段的生成器"""
+        return self._stream("/v1/ask", {"prompt": prompt}, on_stage)
+
+    def critique(self, image_path, prompt, on_stage=None):
+        """多模态问答：上传本地图片，返回回答片段的生成器"""
+        with open(image_path, "rb") as f:
+            image = base64.b64encode(f.read()).decode("ascii")
+        payload = {"prompt": prompt, "image": image, "filename": os.path.basename(image_path)}
+        return self._stream("/v1/critique", payload, on_stage)
+
+    def health(self):
+        with urllib.request.urlopen(self.base_url + "/healthz", timeout=self.timeout) as resp:
+            return json.loads(resp.read())
+
+    def _stream(self, path, payload, on_stage):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            resp = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            message = _error_message(e)
+            if e.code == 503:
+                raise ServerBusy(message, e.headers.get("Retry-After")) from None
+            raise GalleryAPIError(f"HTTP {e.code}: {message}") from None
+        except urllib.error.URLError as e:
+            raise GalleryAPIError(f"无法连接服务 {self.base_url}: {e.reason}") from None
+
+        # 生成器被提前关闭时连接随之关闭，服务端据此停止生成
+        with resp:
+            for line in resp:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if "token" in event:
+                    yield event["token"]
+                elif "stage" in event:
+                    if on_stage is not None:
+                        on_stage(event["stage"])
+                elif "error" in event:
+                    raise GalleryAPIError(event["error"])
+                elif event.get("done"):
+                    return
+        raise GalleryAPIError("服务提前关闭了连接")
+
+
+def _error_message(error):
+    try:
+        return json.loads(error.read())["error"]
+    except Exception:
+        return error.reason
@@ -0,0 +1,54 @@
+import json
+import os
+
+from filecache import FileCache
+
+# 大模型响应的磁盘缓存，用于数据集处理等批量调用：同一模型+同样的消息和参数直接复用上次的回答，
+# 重跑或只重新处理一部分数据时几乎不耗时、不花钱。只缓存非流式调用的完整回答文本
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "cache/llm")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
+
+
+class LLMCache:
+    """模型 + 消息 + 请求参数 的哈希 -> 回答文本"""
+
+    def __init__(self, directory=LLM_CACHE_DIR, max_bytes=LLM_CACHE_MAX_MB * 2**20):
+        self.files = FileCache(directory, max_bytes=max_bytes, suffix=".json")
+
+    @staticmethod
+    def key_for(model, messages, **params):
+        # sort_keys保证同样的内容得到同样的键；图片等大字段也直接参与哈希
+        return FileCache.key_for(
+            model,
+            json.dumps(messages, sort_keys=True, ensure_ascii=False),
+            json.dumps(params, sort_keys=True, ensure_ascii=False),
+        )
+
+    def get(self, model, messages, **params):
+        data = self.files.get(self.key_for(model, messages, **params))
+        if data is None:
+            return None
+        return json.loads(data)["content"]
+
+    def put(self, model, messages, content, **params):
+        record = {"model": model, "content": content}
+        self.files.put(self.key_for(model, messages, **params), json.dumps(record, ensure_ascii=False).encode("utf-8"))
+
+    def stats(self):
+        return self.files.stats()
+
+
+def cached_completion(client, model, messages, cache=None, **params):
+    """
+    非流式调用chat.completions并返回回答文本；传入cache（LLMCache）时先查缓存，
+    未命中才真正请求，且只缓存非空回答
+    """
+    if cache is not None:
+        content = cache.get(model, messages, **params)
+        if content is not None:
+            return content
+    resp = client.chat.completions.create(model=model, messages=messages, **params)
+    content = resp.choices[0].message.content if resp and resp.choices else ""
+    if cache is not None and content:
+        cache.put(model, messages, content, **params)
+    return content or ""
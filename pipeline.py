@@ -0,0 +1,107 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from embedding import process_embbeding, get_similar_file
+from querygraph import queryImage
+from vllm import call_vllm_stream, encode_reference_images, encode_target_image
+
+
+class Stage:
+    """流水线中的一个阶段：fn接收依赖阶段的结果（按deps顺序）作为参数"""
+
+    def __init__(self, name, fn, deps=()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+
+def run_stages(stages, max_workers=4, on_stage=None):
+    """
+    按依赖关系并发执行各阶段：依赖全部完成的阶段立即提交到线程池。
+    on_stage(name)只在调用线程中触发（Streamlit等UI不允许在工作线程中更新界面）。
+    任一阶段失败时取消尚未开始的阶段并抛出异常。
+
+    返回：
+        (results, timings)：阶段名 -> 结果，阶段名 -> 耗时（秒）
+    """
+    stages = {s.name: s for s in stages}
+    for s in stages.values():
+        missing = [d for d in s.deps if d not in stages]
+        if missing:
+            raise ValueError(f"阶段 {s.name} 依赖未定义的阶段: {missing}")
+
+    results = {}
+    timings = {}
+    started = {}
+    running = {}
+
+    def timed(stage, args):
+        start = time.perf_counter()
+        try:
+            return stage.fn(*args)
+        finally:
+            timings[stage.name] = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(results) < len(stages):
+            for s in stages.values():
+                if s.name not in started and all(d in results for d in s.deps):
+                    if on_stage is not None:
+                        on_stage(s.name)
+                    started[s.name] = True
+                    # 在调用线程的上下文副本中执行，阶段内的span保留当前请求的关联ID
+                    ctx = contextvars.copy_context()
+                    running[executor.submit(ctx.run, timed, s, [results[d] for d in s.deps])] = s.name
+            if not running:
+                raise ValueError(f"阶段依赖存在环: {[n for n in stages if n not in results]}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    for f in running:
+                        f.cancel()
+                    raise
+    return results, timings
+
+
+def format_timings(timings):
+    return ", ".join(f"{name} {t * 1000:.0f}ms" for name, t in timings.items())
+
+
+def run_image_pipeline(image_path, prompt, llm, graph, client, model, url, username, password,
+                       num=1, on_stage=None, timings=None):
+    """
+    多模态问答流水线（流式产出回答）。阶段依赖关系：
+        embed -> search -> kg ----------\\
+                       \\-> encode_refs --+-> 调用多模态模型
+        encode_target ------------------/
+    目标图片编码与CLIP编码并行，参考图片编码与图谱查询并行。
+    传入timings（dict）时，会写入各阶段耗时（秒），以及模型首token时间first_token和生成总耗时generate。
+    """
+    stages = [
+        Stage("embed", lambda: process_embbeding(image_path)),
+        Stage("encode_target", lambda: encode_target_image(image_path, num)),
+        Stage("search", lambda emb: get_similar_file(url, username, password, emb, num=num), deps=["embed"]),
+        Stage("kg", lambda filenames: queryImage(llm, graph, top_k=20, image_filenames=filenames), deps=["search"]),
+        Stage("encode_refs", lambda filenames, target: encode_reference_images(filenames, target[1]),
+              deps=["search", "encode_target"]),
+    ]
+    start = time.perf_counter()
+    results, stage_timings = run_stages(stages, on_stage=on_stage)
+    print(f"阶段耗时: {format_timings(stage_timings)}，合计 {(time.perf_counter() - start) * 1000:.0f}ms")
+    if timings is not None:
+        timings.update(stage_timings)
+
+    start = time.perf_counter()
+    for i, token in enumerate(call_vllm_stream(
+        client, model, results["kg"], prompt, image_path, results["search"],
+        on_stage=on_stage, target=results["encode_target"], references=results["encode_refs"],
+    )):
+        if i == 0 and timings is not None:
+            timings["first_token"] = time.perf_counter() - start
+        yield token
+    if timings is not None:
+        timings["generate"] = time.perf_counter() - start
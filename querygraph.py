@@ -1,23 +1,189 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import List, TypedDict
+
 from langchain_neo4j import GraphCypherQAChain, Neo4jGraph
+from langchain_neo4j.chains.graph_qa.cypher import extract_cypher
+
+from tracing import TOKEN_BUCKETS, inc, observe, record_cache, span
+
+# 批量查询作品在各审美维度上的等级和原因（HAS_LEVEL）
+IMAGE_LEVEL_QUERY = """
+UNWIND $filenames AS filename
+MATCH (a:Artwork {filename: filename})-[r:HAS_LEVEL]->(d)
+RETURN a.filename AS filename, d.id AS dimension, r.level AS level, coalesce(r.reason, "") AS reason
+"""
+
+class LevelRecord(TypedDict):
+    filename: str
+    dimension: str
+    level: str
+    reason: str
+
+# 图谱schema与QA链缓存：schema在TTL内只刷新一次，QA链按(llm, graph, top_k)复用，
+# schema刷新后自动重建；导入数据后由server.py的 POST /v1/admin/reload 调用invalidateCache()立即失效
+SCHEMA_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "600"))
+_schemas = {}   # id(graph) -> (graph, 刷新时间, 版本号)
+_chains = {}    # (id(llm), id(graph), top_k) -> (llm, graph, schema版本号, chain)
+_cache_lock = threading.Lock()
+
+def ensureSchema(graph,ttl=None):
+    """schema超过TTL才刷新，返回当前schema版本号"""
+    ttl = SCHEMA_TTL if ttl is None else ttl
+    with _cache_lock:
+        entry = _schemas.get(id(graph))
+        if entry is not None and time.monotonic() - entry[1] < ttl:
+            return entry[2]
+        graph.refresh_schema()
+        version = entry[2] + 1 if entry is not None else 0
+        _schemas[id(graph)] = (graph, time.monotonic(), version)
+        return version
+
+def getQAChain(llm,graph,top_k=20,ttl=None):
+    """返回缓存的GraphCypherQAChain，schema过期或失效后重新构建"""
+    version = ensureSchema(graph, ttl)
+    key = (id(llm), id(graph), top_k)
+    with _cache_lock:
+        entry = _chains.get(key)
+        if entry is not None and entry[2] == version:
+            return entry[3]
+        # 初始化Cypher QA链
+        chain = GraphCypherQAChain.from_llm(
+            llm=llm,
+            graph=graph,
+            verbose=True,
+            top_k=top_k,
+            allow_dangerous_requests=True
+        )
+        _chains[key] = (llm, graph, version, chain)
+        return chain
+
+def invalidateCache(graph=None):
+    """清空schema与QA链缓存；指定graph时只清空与之相关的部分"""
+    with _cache_lock:
+        if graph is None:
+            _schemas.clear()
+            _chains.clear()
+            return
+        _schemas.pop(id(graph), None)
+        for key in [k for k in _chains if k[1] == id(graph)]:
+            del _chains[key]
+
+def cacheScope(chain,top_k):
+    """Cypher缓存的作用域：同一schema、同一top_k下缓存的Cypher和回答才能复用"""
+    schema = hashlib.sha1(chain.graph_schema.encode("utf-8")).hexdigest()[:12]
+    return f"{schema}:{top_k}"
+
+def _modelName(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+def _textChunk(chunk):
+    # 兼容返回dict的旧版LLMChain
+    return chunk["text"] if isinstance(chunk, dict) else chunk
+
+#纯文本问答（流式）：生成Cypher -> 查询图谱 -> 逐token产出回答
+#传入cache（cyphercache.CypherCache）时，相同的问题复用已验证的Cypher，跳过Cypher生成的大模型调用
+#on_stage(name)在进入每个阶段时被调用，用于展示进度
+def queryGraphStream(llm,graph,query,top_k=20,cache=None,on_stage=None):
+    stage = on_stage or (lambda name: None)
+    chain = getQAChain(llm, graph, top_k)
+
+    stage("cypher")
+    cypher = None
+    context = None
+    scope = cacheScope(chain, top_k) if cache is not None else None
+    hit = cache.lookup(query, scope) if cache is not None else None
+    if cache is not None:
+        record_cache("cypher", hit is not None)
+    if hit is not None:
+        if hit.get("answer"):
+            yield hit["answer"]
+            return
+        try:
+            with span("cypher_query", cached=True) as sp:
+                context = graph.query(hit["cypher"])[:top_k]
+                sp.set(rows=len(context))
+        except Exception as e:
+            # schema变化等原因导致缓存的Cypher失效，丢弃后走正常流程
+            print(f"缓存的Cypher执行失败，已丢弃: {e}")
+            cache.invalidate(hit["question"], scope)
+            hit = None
+    if hit is None:
+        with span("cypher_generate"):
+            # 与GraphCypherQAChain._call保持一致，新版默认prompt需要examples变量
+            generated = chain.cypher_generation_chain.invoke({"question": query, "examples": None, "schema": chain.graph_schema})
+            cypher = extract_cypher(_textChunk(generated))
+        print(f"Generated Cypher:\n{cypher}")
+        stage("query")
+        with span("cypher_query", cached=False) as sp:
+            context = graph.query(cypher)[:top_k] if cypher else []
+            sp.set(rows=len(context))
+
+    stage("answer")
+    parts = []
+    # 流式回答的片段数近似为输出token数
+    with span("answer", model=_modelName(llm)) as sp:
+        for chunk in chain.qa_chain.stream({"question": query, "context": context}):
+            chunk = _textChunk(chunk)
+            if not parts:
+                sp.set(ttft_ms=round(sp.elapsed() * 1000, 2))
+            parts.append(chunk)
+            yield chunk
+        sp.set(output_tokens=len(parts))
+    inc("gallery_llm_output_tokens_total", len(parts), model=_modelName(llm))
+    observe("gallery_llm_output_tokens", len(parts), buckets=TOKEN_BUCKETS, model=_modelName(llm))
+
+    # 只缓存执行成功且查到结果的Cypher
+    if cache is not None and cypher and context:
+        cache.store(query, cypher, "".join(parts), scope)
 
 #纯文本问答，直接查询图谱
-def queryGraph(llm,graph,query,top_k=20):
-    graph.refresh_schema()
+def queryGraph(llm,graph,query,top_k=20,cache=None):
+    return "".join(queryGraphStream(llm, graph, query, top_k, cache))
+
+
+# 直接用参数化Cypher一次查出多张作品的维度得分，无需大模型参与
+def fetchImageLevels(graph,image_filenames) -> List[LevelRecord]:
+    if not image_filenames:
+        return []
+    with span("kg_levels", images=len(image_filenames)) as sp:
+        rows = graph.query(IMAGE_LEVEL_QUERY, params={"filenames": list(image_filenames)})
+        sp.set(rows=len(rows))
+    order = {name: i for i, name in enumerate(image_filenames)}
+    records = [
+        LevelRecord(
+            filename=row["filename"],
+            dimension=row["dimension"],
+            level=row["level"],
+            reason=row["reason"],
+        )
+        for row in rows
+    ]
+    records.sort(key=lambda r: (order.get(r["filename"], len(order)), r["dimension"]))
+    return records
+
 
-    # 初始化Cypher QA链
-    chain = GraphCypherQAChain.from_llm(
-        llm=llm,
-        graph=graph,
-        verbose=True,
-        top_k=top_k,
-        allow_dangerous_requests=True
-    )
-    res = chain.invoke({"query": query})  
-    return res['result']
+# 批量版本：一次查询取回多组作品的维度得分，每组返回与queryImage相同格式的JSON字符串
+def queryImagesBatch(graph,filename_groups) -> List[str]:
+    unique = list(dict.fromkeys(f for group in filename_groups for f in group))
+    by_file = {}
+    for record in fetchImageLevels(graph, unique):
+        by_file.setdefault(record["filename"], []).append(record)
+    return [
+        json.dumps([r for f in group for r in by_file.get(f, [])], ensure_ascii=False, indent=2)
+        for group in filename_groups
+    ]
 
 
 # 查询图片维度得分信息，格式化返回
-def queryImage(llm,graph,top_k=20,image_filenames=[]):
+# 默认走确定性的Cypher查询；use_llm=True时改用大模型生成Cypher并整理JSON（旧流程）
+def queryImage(llm,graph,top_k=20,image_filenames=[],use_llm=False):
+    if image_filenames and not use_llm:
+        records = fetchImageLevels(graph, image_filenames)
+        return json.dumps(records, ensure_ascii=False, indent=2)
     if image_filenames:
         filename_str = ", ".join(image_filenames)
         query = f"""
@@ -41,15 +207,7 @@ def queryImage(llm,graph,top_k=20,image_filenames=[]):
         ]
         Note: You must only return JSON (do not include any extra text, comments, or formatting).
         """
-        graph.refresh_schema()
-        
-        chain = GraphCypherQAChain.from_llm(
-            llm=llm,
-            graph=graph,
-            verbose=True,
-            top_k=top_k,
-            allow_dangerous_requests=True
-        )
+        chain = getQAChain(llm, graph, top_k)
         res = chain.invoke({"query": query})
         kg=res['result']
         return kg
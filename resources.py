@@ -0,0 +1,78 @@
+import threading
+import time
+
+# 进程级资源缓存：模型、数据库连接、API客户端等重量级对象在首次使用时才创建，
+# 之后整个进程（所有Streamlit会话和线程）共享同一个实例
+
+# 近似的进程启动时刻（本模块首次被导入时）
+PROCESS_START = time.perf_counter()
+
+_resources = {}
+_locks = {}
+_load_times = {}
+_events = {}
+_lock = threading.Lock()
+
+
+def get_resource(name, factory):
+    """返回名为name的资源，不存在时调用factory()创建；同一资源只会被创建一次"""
+    resource = _resources.get(name)
+    if resource is not None:
+        return resource
+    with _lock:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _resources:
+            start = time.perf_counter()
+            _resources[name] = factory()
+            _load_times[name] = time.perf_counter() - start
+            print(f"资源已加载: {name}（{_load_times[name]:.2f}s）")
+        return _resources[name]
+
+
+def is_loaded(name):
+    return name in _resources
+
+
+def drop_resource(name):
+    """移除缓存的资源（例如连接失效后需要重建）"""
+    with _lock:
+        _load_times.pop(name, None)
+        return _resources.pop(name, None)
+
+
+def mark(event):
+    """记录事件距进程启动的时刻，只记录第一次；首次记录时返回True"""
+    with _lock:
+        if event in _events:
+            return False
+        _events[event] = time.perf_counter() - PROCESS_START
+        return True
+
+
+def startup_report():
+    """启动耗时报告：各事件时刻与各资源的加载耗时"""
+    lines = ["启动耗时报告:"]
+    for event, t in sorted(_events.items(), key=lambda e: e[1]):
+        lines.append(f"  {event}: {t:.2f}s")
+    for name, t in _load_times.items():
+        lines.append(f"  加载 {name}: {t:.2f}s")
+    return "\n".join(lines)
+
+
+def warmup(loaders, background=True):
+    """预热：依次调用loaders中的函数（通常是get_xxx），默认在后台守护线程中执行，不阻塞首屏"""
+    def run():
+        for loader in loaders:
+            try:
+                loader()
+            except Exception as e:
+                print(f"预热失败 {getattr(loader, '__name__', loader)}: {e}")
+        mark("warmup_done")
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
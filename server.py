@@ -0,0 +1,450 @@
+import argparse
+import base64
+import binascii
+import contextvars
+import json
+import os
+import queue
+import select
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+from resources import get_resource, mark, startup_report, warmup
+from querygraph import invalidateCache, queryGraphStream
+from cyphercache import CypherCache
+from tracing import inc, log_event, observe, render_metrics, span, trace_request
+
+mark("imports")
+
+# 独立的HTTP服务：模型、数据库连接在进程内只加载一次，由固定数量的工作线程执行问答，
+# 等待队列满时直接返回503（背压），回答以NDJSON分块流式返回。Streamlit前端（frontend.py）
+# 和其他服务都通过它调用，可以部署多个实例做负载均衡
+#
+#   POST /v1/ask       {"prompt": "..."}                                   纯文本问答
+#   POST /v1/critique  {"prompt": "...", "image": base64, "filename": ...} 多模态问答
+#   POST /v1/admin/reload                                                   导入数据后清空schema、QA链与Cypher缓存
+#   GET  /healthz      工作线程与队列占用情况
+#   GET  /metrics      Prometheus格式指标
+#
+# 流式响应每行一个JSON事件：{"stage": 阶段名} / {"token": 文本} / {"error": 信息} / {"done": true}；
+# 请求体中"stream": false时等回答完成后一次返回 {"answer": ..., "request_id": ...}
+
+load_dotenv()
+
+# 配置neo4j
+url = os.getenv("NEO4J_URI", "neo4j://localhost:7687")
+username = os.getenv("NEO4J_USERNAME", "neo4j")
+password = os.getenv("NEO4J_PASSWORD", "apropos-sphere-violin-texas-strong-2496")
+
+GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4o-mini")
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+# 同时执行的问答数；超出后最多再排队SERVER_QUEUE个，其余请求返回503
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "4"))
+SERVER_QUEUE = int(os.getenv("SERVER_QUEUE", "8"))
+# 请求体上限（图片以base64放在JSON中）
+SERVER_MAX_BODY_MB = int(os.getenv("SERVER_MAX_BODY_MB", "20"))
+# 上传图片的临时目录，回答结束后删除
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "gallery-uploads"))
+# 非流式请求等待回答期间，每隔这么久检查一次客户端是否已断开
+COLLECT_POLL_SECONDS = 0.5
+
+
+# 数据库连接和模型客户端在首次使用时创建，整个进程共享
+def get_graph():
+    def create():
+        from langchain_neo4j import Neo4jGraph
+        return Neo4jGraph(
+            url=url,
+            username=username,
+            password=password,
+            # enhanced_schema=True,
+        )
+    return get_resource("neo4j_graph", create)
+
+def get_deepseek_llm():
+    def create():
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model_name="deepseek-chat",
+            openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
+            openai_api_base="https://api.deepseek.com/v1",
+            streaming=True
+        )
+    return get_resource("deepseek_llm", create)
+
+def get_openai_client():
+    def create():
+        from openai import OpenAI
+        return OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url='https://openai.api2d.net/v1'
+        )
+    return get_resource("openai_client", create)
+
+# 问题 -> Cypher 语义缓存，重复/相似的问题跳过Cypher生成
+def get_cypher_cache():
+    return get_resource("cypher_cache", lambda: CypherCache(
+        path=os.getenv("CYPHER_CACHE_PATH", "cache/cypher_cache.json"),
+        cache_answers=os.getenv("CYPHER_CACHE_ANSWERS", "0") == "1",
+    ))
+
+# 导入数据后调用（POST /v1/admin/reload，或load_graph.py --reload-server），新数据立即可查；
+# 缓存的Cypher和回答按旧数据得到，一并清空
+def reload_caches():
+    invalidateCache()
+    get_cypher_cache().clear()
+    return {"status": "ok"}
+
+def warmup_vision():
+    # 多模态链路（CLIP、torch）只在需要时导入
+    from embedding import warmup as warmup_clip
+    warmup_clip()
+
+# 纯文本问答，调用图谱QA（流式产出回答）
+def get_response_languageOnly(prompt,on_stage=None):
+    return queryGraphStream(get_deepseek_llm(),get_graph(),prompt,10,cache=get_cypher_cache(),on_stage=on_stage)
+
+# 多模态问答，查找相似图片+图谱QA+调用多模态模型（各阶段并发执行，流式产出回答）
+def get_response_forImage(image_path,prompt,on_stage=None):
+    from pipeline import run_image_pipeline
+    return run_image_pipeline(
+        image_path, prompt, get_deepseek_llm(), get_graph(), get_openai_client(), GPT_MODEL,
+        url, username, password, num=1, on_stage=on_stage,
+    )
+
+
+class WorkerPool:
+    """固定数量的工作线程 + 有界等待队列；容量已满时submit返回None，由调用方回复503"""
+
+    def __init__(self, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="worker")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            return None
+        submitted = time.perf_counter()
+
+        def run():
+            with self._lock:
+                self._running += 1
+            observe("gallery_queue_wait_seconds", time.perf_counter() - submitted)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        def release(_):
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+        with self._lock:
+            self._pending += 1
+        # 在提交线程的上下文副本中执行，工作线程中的span保留当前请求的关联ID
+        ctx = contextvars.copy_context()
+        try:
+            future = self.executor.submit(ctx.run, run)
+        except BaseException:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "capacity": self.capacity,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def pump(make_stream, mode, events, cancelled):
+    """
+    在工作线程中执行一次问答：make_stream(on_stage)返回回答的生成器，
+    阶段和token依次放入events队列，最后放入None；客户端断开（cancelled）后关闭生成器
+    """
+    stream = None
+    with span("request", mode=mode) as sp:
+        try:
+            if not cancelled.is_set():
+                stream = make_stream(lambda name: events.put({"stage": name}))
+                for token in stream:
+                    if cancelled.is_set():
+                        break
+                    events.put({"token": token})
+            if cancelled.is_set():
+                sp.set(cancelled=True)
+            else:
+                events.put({"done": True})
+        except Exception as e:
+            sp.record_error(e)
+            events.put({"error": f"{type(e).__name__}: {e}"})
+        finally:
+            if stream is not None:
+                stream.close()
+            events.put(None)
+
+
+class RequestError(Exception):
+    """请求不合法，回复status和message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def text_request(server, body):
+    prompt = _prompt(body)
+    return lambda on_stage: server.text_fn(prompt, on_stage=on_stage)
+
+
+def image_request(server, body):
+    prompt = _prompt(body)
+    try:
+        image = base64.b64decode(body.get("image") or "", validate=True)
+    except (binascii.Error, TypeError):
+        raise RequestError(400, "image must be base64-encoded")
+    if not image:
+        raise RequestError(400, "image is required")
+    suffix = os.path.splitext(str(body.get("filename") or ""))[1].lower() or ".jpg"
+
+    def make_stream(on_stage):
+        # 在工作线程中才写入临时文件，被拒绝的请求不会留下文件
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=UPLOAD_DIR)
+        with os.fdopen(fd, "wb") as f:
+            f.write(image)
+
+        def stream():
+            try:
+                yield from server.image_fn(path, prompt, on_stage=on_stage)
+            finally:
+                os.remove(path)
+        return stream()
+    return make_stream
+
+
+def _prompt(body):
+    prompt = body.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise RequestError(400, "prompt is required")
+    return prompt
+
+
+ROUTES = {
+    "/v1/ask": ("text", text_request),
+    "/v1/critique": ("image", image_request),
+}
+
+
+class GalleryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/healthz":
+            self._send_json(200, {"status": "ok", **self.server.pool.stats()})
+        elif path == "/metrics":
+            self._send(200, render_metrics().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path.split("?")[0] == "/v1/admin/reload":
+            self._reload()
+            return
+        route = ROUTES.get(self.path.split("?")[0])
+        if route is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        mode, build = route
+        try:
+            body = self._read_json()
+            make_stream = build(self.server, body)
+        except RequestError as e:
+            self._send_json(e.status, {"error": str(e)})
+            return
+
+        request_id = (self.headers.get("X-Request-ID") or "")[:64] or None
+        with trace_request(request_id) as request_id:
+            events = queue.Queue()
+            cancelled = threading.Event()
+            if self.server.pool.submit(pump, make_stream, mode, events, cancelled) is None:
+                inc("gallery_requests_rejected_total", mode=mode)
+                log_event("rejected", mode=mode, **self.server.pool.stats())
+                self._send_json(503, {"error": "server busy, retry later"}, {"Retry-After": "1"})
+                return
+            if body.get("stream", True):
+                self._stream(events, cancelled, request_id)
+            else:
+                self._collect(events, cancelled, request_id)
+
+    def _reload(self):
+        try:
+            # 读完请求体，连接才能继续复用
+            self._read_json()
+        except RequestError as e:
+            self._send_json(e.status, {"error": str(e)})
+            return
+        self._send_json(200, reload_caches())
+
+    def _stream(self, events, cancelled, request_id):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        # 关闭反向代理（如nginx）的缓冲，token到达即转发
+        self.send_header("X-Accel-Buffering", "no")
+        self.send_header("X-Request-ID", request_id)
+        self.end_headers()
+        try:
+            while (event := events.get()) is not None:
+                self._write_chunk((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开：通知工作线程停止生成，释放工作线程
+            cancelled.set()
+            self.close_connection = True
+
+    def _collect(self, events, cancelled, request_id):
+        tokens = []
+        error = None
+        checked = time.monotonic()
+        while True:
+            try:
+                event = events.get(timeout=COLLECT_POLL_SECONDS)
+            except queue.Empty:
+                event = {}
+            if event is None:
+                break
+            if "token" in event:
+                tokens.append(event["token"])
+            elif "error" in event:
+                error = event["error"]
+            # 回答完成前不写响应，只能定期检查连接：客户端已断开则通知工作线程停止生成
+            if time.monotonic() - checked >= COLLECT_POLL_SECONDS:
+                checked = time.monotonic()
+                if self._client_gone():
+                    cancelled.set()
+                    self.close_connection = True
+                    return
+        headers = {"X-Request-ID": request_id}
+        try:
+            if error is not None:
+                self._send_json(500, {"error": error, "request_id": request_id}, headers)
+            else:
+                self._send_json(200, {"answer": "".join(tokens), "request_id": request_id}, headers)
+        except (BrokenPipeError, ConnectionResetError):
+            cancelled.set()
+            self.close_connection = True
+
+    def _client_gone(self):
+        """连接可读且读到EOF（或出错）即客户端已关闭"""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise RequestError(400, "invalid Content-Length")
+        if length > self.server.max_body:
+            self.close_connection = True
+            raise RequestError(413, f"request body exceeds {self.server.max_body} bytes")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise RequestError(400, "body must be JSON")
+        if not isinstance(body, dict):
+            raise RequestError(400, "body must be a JSON object")
+        return body
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8", headers)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GalleryServer(ThreadingHTTPServer):
+    """
+    每个连接一个处理线程（只负责收发），问答在pool的工作线程中执行。
+    text_fn(prompt, on_stage) / image_fn(image_path, prompt, on_stage) 返回回答的生成器，
+    默认即 get_response_languageOnly / get_response_forImage
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, pool, text_fn=None, image_fn=None, max_body=SERVER_MAX_BODY_MB * 2**20):
+        super().__init__(address, GalleryHandler)
+        self.pool = pool
+        self.text_fn = text_fn or get_response_languageOnly
+        self.image_fn = image_fn or get_response_forImage
+        self.max_body = max_body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gallery AI HTTP服务：纯文本问答与多模态问答（流式）")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="同时执行的问答数")
+    parser.add_argument("--queue", type=int, default=SERVER_QUEUE, help="排队上限，超出返回503")
+    parser.add_argument("--warmup", action="store_true", default=os.getenv("WARMUP", "0") == "1",
+                        help="启动后在后台预先建立连接并加载CLIP")
+    args = parser.parse_args()
+
+    pool = WorkerPool(args.workers, args.queue)
+    server = GalleryServer((args.host, args.port), pool)
+    if args.warmup:
+        warmup([get_graph, get_deepseek_llm, get_openai_client, warmup_vision])
+    mark("listening")
+    print(startup_report())
+    print(f"服务已启动: http://{args.host}:{server.server_address[1]}（{args.workers}个工作线程，排队上限{args.queue}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
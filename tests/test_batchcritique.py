@@ -0,0 +1,79 @@
+import importlib
+import json
+import sys
+import threading
+import types
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def batchcritique(monkeypatch):
+    # embedding loads CLIP and Neo4j; critique_batch only needs embed_images / get_similar_files,
+    # which each test replaces anyway
+    embedding = types.ModuleType("embedding")
+    embedding.embed_images = embedding.get_similar_files = None
+    monkeypatch.setitem(sys.modules, "embedding", embedding)
+    monkeypatch.delitem(sys.modules, "batchcritique", raising=False)
+    module = importlib.import_module("batchcritique")
+    yield module
+    sys.modules.pop("batchcritique", None)
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_in_flight_results_are_written_when_a_later_chunk_fails(batchcritique, monkeypatch, tmp_path):
+    items = [{"image": f"img{i}.jpg", "prompt": "p"} for i in range(6)]
+    release = threading.Event()
+    searches = []
+
+    def embed_images(paths, batch_size=32):
+        return np.ones((len(paths), 4), dtype=np.float32), np.ones(len(paths), dtype=bool)
+
+    def get_similar_files(url, username, password, embs, num=1, backend=None):
+        searches.append(len(embs))
+        if len(searches) == 2:
+            # the first chunk's vision calls are still in flight when this raises
+            raise ConnectionError("neo4j unavailable")
+        return [["ref.jpg"]] * len(embs)
+
+    def call_vllm(client, model, kg, prompt, image, neighbours, cache=None):
+        release.wait(5)
+        return f"critique of {image}"
+
+    monkeypatch.setattr(batchcritique, "embed_images", embed_images)
+    monkeypatch.setattr(batchcritique, "get_similar_files", get_similar_files)
+    monkeypatch.setattr(batchcritique, "queryImagesBatch", lambda graph, groups: ["[]"] * len(groups))
+    monkeypatch.setattr(batchcritique, "call_vllm", call_vllm)
+    threading.Timer(0.2, release.set).start()
+
+    output = str(tmp_path / "critiques.jsonl")
+    with pytest.raises(ConnectionError):
+        batchcritique.critique_batch(items, None, "model", None, output, chunk_size=3, concurrency=3)
+
+    records = read_records(output)
+    assert sorted(r["image"] for r in records) == ["img0.jpg", "img1.jpg", "img2.jpg"]
+    assert all(r["status"] == "ok" for r in records)
+    assert batchcritique.load_done(output) == {"img0.jpg", "img1.jpg", "img2.jpg"}
+
+
+def test_rerun_skips_completed_images(batchcritique, monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(batchcritique, "embed_images",
+                        lambda paths, batch_size=32: (np.ones((len(paths), 4), np.float32), np.ones(len(paths), bool)))
+    monkeypatch.setattr(batchcritique, "get_similar_files",
+                        lambda url, username, password, embs, num=1, backend=None: [["ref.jpg"]] * len(embs))
+    monkeypatch.setattr(batchcritique, "queryImagesBatch", lambda graph, groups: ["[]"] * len(groups))
+    monkeypatch.setattr(batchcritique, "call_vllm",
+                        lambda client, model, kg, prompt, image, neighbours, cache=None: calls.append(image) or "ok")
+
+    output = str(tmp_path / "critiques.jsonl")
+    items = [{"image": f"img{i}.jpg", "prompt": "p"} for i in range(4)]
+    batchcritique.critique_batch(items[:2], None, "model", None, output)
+    summary = batchcritique.critique_batch(items, None, "model", None, output)
+    assert summary["skipped"] == 2 and summary["ok"] == 2
+    assert sorted(calls) == [f"img{i}.jpg" for i in range(4)]
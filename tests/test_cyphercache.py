@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from cyphercache import CypherCache
+
+# Near-identical wording, opposite meaning: a hit on any of these reuses the wrong Cypher
+NEGATIVE_PAIRS = [
+    ("Show artworks with Very Good layout and composition",
+     "Show artworks with Very Poor layout and composition"),
+    ("Which artworks have a good overall level?",
+     "Which artworks have a poor overall level?"),
+    ("show 5 artworks of traditional Chinese painting",
+     "show 3 artworks of traditional Chinese painting"),
+]
+
+
+@pytest.mark.parametrize("stored, asked", NEGATIVE_PAIRS)
+def test_opposite_questions_miss(stored, asked):
+    cache = CypherCache(cache_answers=True)
+    cache.store(stored, "MATCH (a) RETURN a", answer="stored answer")
+    assert cache.lookup(asked) is None
+    assert cache.lookup(stored)["cypher"] == "MATCH (a) RETURN a"
+
+
+def test_exact_match_ignores_case_and_punctuation():
+    cache = CypherCache()
+    cache.store("How many artworks are there?", "MATCH (a:Artwork) RETURN count(a)")
+    assert cache.lookup("how many   artworks are there")["cypher"] == "MATCH (a:Artwork) RETURN count(a)"
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_fuzzy_matching_requires_an_embedding():
+    with pytest.raises(ValueError):
+        CypherCache(threshold=0.9)
+
+
+def test_fuzzy_matching_uses_given_embedding():
+    vectors = {"count artworks": [1.0, 0.0], "number of artworks": [0.96, 0.28], "list styles": [0.0, 1.0]}
+    cache = CypherCache(threshold=0.9, embed_fn=lambda q: np.array(vectors[q], dtype=np.float32))
+    cache.store("count artworks", "MATCH (a:Artwork) RETURN count(a)")
+    assert cache.lookup("number of artworks") is not None
+    assert cache.lookup("list styles") is None
+
+
+def test_persists_and_reloads(tmp_path):
+    path = str(tmp_path / "cypher_cache.json")
+    CypherCache(path=path).store("How many artworks?", "MATCH (a:Artwork) RETURN count(a)")
+    assert CypherCache(path=path).lookup("how many artworks")["cypher"] == "MATCH (a:Artwork) RETURN count(a)"
+
+
+def test_entries_are_scoped():
+    cache = CypherCache(cache_answers=True)
+    cache.store("how many artworks", "MATCH (a:Artwork) RETURN count(a)", answer="42", scope="schema-a:10")
+    assert cache.lookup("how many artworks", scope="schema-a:10")["answer"] == "42"
+    assert cache.lookup("how many artworks", scope="schema-a:20") is None
+    assert cache.lookup("how many artworks", scope="schema-b:10") is None
+    assert cache.lookup("how many artworks") is None
+    cache.invalidate("how many artworks", scope="schema-a:10")
+    assert len(cache) == 0
+
+
+def test_fuzzy_matching_stays_within_scope(tmp_path):
+    vectors = {"count artworks": [1.0, 0.0], "number of artworks": [0.96, 0.28]}
+    embed_fn = lambda q: np.array(vectors[q], dtype=np.float32)  # noqa: E731
+    path = str(tmp_path / "cypher_cache.json")
+    CypherCache(path=path, threshold=0.9, embed_fn=embed_fn).store(
+        "Count artworks?", "MATCH (a:Artwork) RETURN count(a)", scope="schema-a:10")
+    cache = CypherCache(path=path, threshold=0.9, embed_fn=embed_fn)
+    assert cache.lookup("number of artworks", scope="schema-a:10") is not None
+    assert cache.lookup("number of artworks", scope="schema-a:20") is None
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from embedstore import EmbeddingStore, EmbeddingStoreWriter, write_store
+
+
+def test_round_trip(tmp_path):
+    embeddings = np.eye(3, 4, dtype=np.float32)
+    write_store(str(tmp_path), ["1", "2", "3"], ["a.jpg", "b.jpg", "c.jpg"], embeddings, valid=[True, False, True])
+    store = EmbeddingStore(str(tmp_path))
+    assert store.dim == 4 and len(store) == 3
+    np.testing.assert_array_equal(store.get("c.jpg"), embeddings[2])
+    assert store.get("b.jpg") is None
+
+
+def test_store_opens_after_writer_is_abandoned(tmp_path):
+    # A run that dies between batches never reaches close()
+    writer = EmbeddingStoreWriter(str(tmp_path), ["1", "2", "3", "4"], ["a", "b", "c", "d"], dim=2)
+    writer.write(0, np.ones((2, 2), dtype=np.float32), [True, False])
+    store = EmbeddingStore(str(tmp_path))
+    assert store.meta["valid"] == 1
+    assert store.valid.tolist() == [True, False, False, False]
+    np.testing.assert_array_equal(store.get("a"), [1.0, 1.0])
+
+
+def test_batched_conversion_keeps_finished_batches_on_failure(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from PIL import Image
+    from tools import convert_embedding
+
+    class FailingEncoder:
+        dim = 2
+        calls = 0
+
+        def preprocess(self, images):
+            return [np.zeros(3, dtype=np.float32) for _ in images]
+
+        def encode(self, pixel_values):
+            self.calls += 1
+            if self.calls == 2:
+                raise RuntimeError("encoder crashed")
+            return np.ones((len(pixel_values), self.dim), dtype=np.float32)
+
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for name in "abcd":
+        Image.new("RGB", (8, 8)).save(image_dir / f"{name}.png")
+    csv_path = tmp_path / "Artwork.csv"
+    csv_path.write_text("id,filename\n" + "".join(f"{i},{n}.png\n" for i, n in enumerate("abcd", 1)))
+    monkeypatch.setattr(convert_embedding, "create_encoder", lambda backend, device: FailingEncoder())
+
+    store_path = str(tmp_path / "embeddings")
+    with pytest.raises(RuntimeError):
+        convert_embedding.embed_images_batched(str(csv_path), store_path, str(image_dir), batch_size=2, num_workers=1)
+    assert EmbeddingStore(store_path).valid.tolist() == [True, True, False, False]
+
+
+def test_csv_conversion_in_place_replaces_input_only_when_done(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    import pandas as pd
+    from PIL import Image
+    from tools import convert_embedding
+
+    class Encoder:
+        dim = 2
+        fail = False
+
+        def preprocess(self, images):
+            return [np.zeros(3, dtype=np.float32) for _ in images]
+
+        def encode(self, pixel_values):
+            if self.fail:
+                raise RuntimeError("encoder crashed")
+            return np.ones((len(pixel_values), self.dim), dtype=np.float32)
+
+    encoder = Encoder()
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for name in "abc":
+        Image.new("RGB", (8, 8)).save(image_dir / f"{name}.png")
+    csv_path = tmp_path / "Artwork.csv"
+    original = "id,filename\n" + "".join(f"{i},{n}.png\n" for i, n in enumerate("abc", 1))
+    csv_path.write_text(original)
+    monkeypatch.setattr(convert_embedding, "create_encoder", lambda backend, device: encoder)
+
+    encoder.fail = True
+    with pytest.raises(RuntimeError):
+        convert_embedding.embed_images_batched(str(csv_path), str(csv_path), str(image_dir), batch_size=2,
+                                               num_workers=1, output_format="csv")
+    assert csv_path.read_text() == original
+
+    encoder.fail = False
+    convert_embedding.embed_images_batched(str(csv_path), str(csv_path), str(image_dir), batch_size=2,
+                                           num_workers=1, output_format="csv")
+    out = pd.read_csv(csv_path, dtype={"id": str})
+    assert out["filename"].tolist() == ["a.png", "b.png", "c.png"]
+    assert out["embedding"].notna().all()
+    assert not (tmp_path / "Artwork.csv.tmp").exists()
@@ -0,0 +1,107 @@
+import json
+
+import pandas as pd
+import pytest
+
+from bench.fake_openai import FakeChatServer
+from tools import enrich_apdd
+
+VALID_REPLY = json.dumps({"reason_for_overall": "balanced composition"})
+
+
+def write_input(path, n):
+    pd.DataFrame({
+        "filename": [f"{i}.jpg" for i in range(n)],
+        "comment": [f"Comment number {i}, the composition is balanced." for i in range(n)],
+    }).to_csv(path, index=False)
+
+
+def test_unparseable_reply_is_not_journaled_and_is_retried(tmp_path):
+    input_path, output_path = str(tmp_path / "APDD.csv"), str(tmp_path / "APDD_enriched.csv")
+    write_input(input_path, 3)
+    replies = iter(["this is not JSON"])
+
+    def responder(body):
+        return next(replies, VALID_REPLY)
+
+    with FakeChatServer(ttft=0, responder=responder) as server:
+        client = enrich_apdd.create_client(server.base_url, api_key="test")
+        enrich_apdd.enrich_csv(input_path, output_path, enrich_apdd.PROMPT_TEMPLATE, concurrency=1, client=client)
+        journal = enrich_apdd.Journal(enrich_apdd.default_journal_path(output_path))
+        assert sorted(journal.load()) == ["1.jpg", "2.jpg"]
+
+        # The resumed run asks only for the row whose reply was garbage
+        enrich_apdd.enrich_csv(input_path, output_path, enrich_apdd.PROMPT_TEMPLATE, concurrency=1, client=client)
+        assert sorted(journal.load()) == ["0.jpg", "1.jpg", "2.jpg"]
+        assert server.requests == 4
+    assert pd.read_csv(output_path)["reason_for_overall"].notna().all()
+
+
+def test_empty_packed_items_are_asked_again_one_by_one(tmp_path):
+    rows = [pd.Series({"filename": f"{i}.jpg", "comment": f"comment {i}"}) for i in range(2)]
+    packed = json.dumps({"results": [{"reason_for_overall": "fine"}, {}]})
+    prompts = []
+
+    def responder(body):
+        prompts.append(body["messages"][-1]["content"])
+        return packed if len(prompts) == 1 else "still not JSON"
+
+    with FakeChatServer(ttft=0, responder=responder) as server:
+        client = enrich_apdd.create_client(server.base_url, api_key="test")
+        updates = enrich_apdd.enrich_batch(rows, enrich_apdd.PROMPT_TEMPLATE, client)
+    assert updates[0]["reason_for_overall"] == "fine"
+    assert not enrich_apdd.has_reasons(updates[1])
+    assert len(prompts) == 2 and "comment 1" in prompts[1]
+
+
+class ScriptedServer(FakeChatServer):
+    """Answers 429 (with Retry-After: 1) for the first `rate_limited_first` requests."""
+
+    def __init__(self, rate_limited_first, **kwargs):
+        super().__init__(ttft=0, **kwargs)
+        self.rate_limited_first = rate_limited_first
+
+    def handle(self, body):
+        with self._lock:
+            limited = self.requests <= self.rate_limited_first
+        if limited:
+            self.rate_limited += 1
+            return 429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit"}}
+        return 200, VALID_REPLY
+
+
+def completion_fn(client):
+    messages = enrich_apdd.model_messages("Comment: fine")
+    return lambda: client.chat.completions.create(model="fake", messages=messages).choices[0].message.content
+
+
+def test_rate_limited_request_is_retried_and_slows_the_limiter():
+    limiter = enrich_apdd.TokenBucket(rate=10)
+    with ScriptedServer(rate_limited_first=1) as server:
+        client = enrich_apdd.create_client(server.base_url, api_key="test")
+        content = enrich_apdd.call_with_backoff(completion_fn(client), limiter, max_retries=3)
+    assert json.loads(content) == json.loads(VALID_REPLY)
+    assert (server.requests, server.rate_limited) == (2, 1)
+    # halved on the 429, then one additive step back up on success
+    assert limiter.rate == pytest.approx(5 + 10 / 20)
+
+
+def test_token_bucket_halves_and_recovers():
+    limiter = enrich_apdd.TokenBucket(rate=8, min_rate=1)
+    limiter.slow_down()
+    assert limiter.rate == 4
+    limiter.slow_down()
+    limiter.slow_down()
+    limiter.slow_down()
+    assert limiter.rate == 1  # floored at min_rate
+    for _ in range(100):
+        limiter.speed_up()
+    assert limiter.rate == 8  # capped at the configured rate
+
+
+def test_gives_up_after_max_retries():
+    with ScriptedServer(rate_limited_first=100) as server:
+        client = enrich_apdd.create_client(server.base_url, api_key="test")
+        with pytest.raises(enrich_apdd.RateLimitError):
+            enrich_apdd.call_with_backoff(completion_fn(client), enrich_apdd.TokenBucket(rate=10), max_retries=1)
+    assert server.requests == 2
@@ -0,0 +1,36 @@
+import os
+
+from filecache import FileCache
+
+
+def disk_bytes(directory):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(directory) for f in files)
+
+
+def test_get_put_and_stats(tmp_path):
+    cache = FileCache(str(tmp_path))
+    key = FileCache.key_for("model", b"image bytes")
+    assert cache.get(key) is None
+    cache.put(key, b"vector")
+    assert cache.get(key) == b"vector"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "bytes": 6}
+
+
+def test_overwriting_a_key_does_not_grow_the_size(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=10_000)
+    for _ in range(50):
+        cache.put("ab" + "0" * 62, b"x" * 1000)
+    assert cache.stats()["bytes"] == 1000
+    assert disk_bytes(str(tmp_path)) == 1000
+
+
+def test_limit_holds_across_instances_sharing_a_directory(tmp_path):
+    # Two processes (here: two instances) each see only their own writes in memory
+    first = FileCache(str(tmp_path), max_bytes=20_000)
+    second = FileCache(str(tmp_path), max_bytes=20_000)
+    for i in range(40):
+        (first if i % 2 else second).put(FileCache.key_for(str(i)), b"x" * 1000)
+    # at most one rescan interval (5% of the limit) per writer above the limit
+    assert disk_bytes(str(tmp_path)) <= 20_000 + 2 * 1000
+    first.sync()
+    assert first.stats()["bytes"] == disk_bytes(str(tmp_path))
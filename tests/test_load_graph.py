@@ -0,0 +1,79 @@
+import csv
+import json
+
+import pytest
+
+from tools.load_graph import (
+    ARTWORK_QUERIES,
+    CONSTRAINTS,
+    EXISTING_ARTWORKS_QUERY,
+    LEVEL_QUERIES,
+    DryRunGraph,
+    GraphLoader,
+    vector_index_statement,
+)
+
+ARTWORKS = ["1", "2", "3", "4", "5"]
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+@pytest.fixture
+def csv_dir(tmp_path):
+    write_csv(tmp_path / "Category.csv", ["id"], [["painting"], ["sketch"]])
+    write_csv(tmp_path / "Artstyle.csv", ["id"], [["realism"]])
+    write_csv(tmp_path / "Subject.csv", ["id"], [["landscape"], ["portrait"], ["still life"]])
+    write_csv(tmp_path / "AestheticDimension.csv", ["id"], [["color"], ["composition"]])
+    write_csv(tmp_path / "Artwork.csv", ["id", "filename", "embedding"],
+              [[i, f"{i}.jpg", json.dumps([0.1] * 4)] for i in ARTWORKS])
+    write_csv(tmp_path / "Artwork_Category.csv", ["artwork", "category"], [[i, "painting"] for i in ARTWORKS])
+    write_csv(tmp_path / "Artwork_STYLE.csv", ["artwork", "style"], [[i, "realism"] for i in ARTWORKS])
+    write_csv(tmp_path / "Artwork_Subject.csv", ["artwork", "subject"], [[i, "landscape"] for i in ARTWORKS])
+    write_csv(tmp_path / "Artwork_DIMENSION.csv", ["artwork", "dimension", "level", "reason"],
+              [[i, d, "good", ""] for i in ARTWORKS for d in ("color", "composition")])
+    return str(tmp_path)
+
+
+def batch_sizes(graph, query):
+    return [size for statement, size in graph.statements if statement == query.strip()]
+
+
+def test_rows_are_sent_in_unwind_batches(csv_dir):
+    graph = DryRunGraph()
+    loader = GraphLoader(graph, csv_dir=csv_dir, batch_size=4, embedding_batch_size=2)
+    loader.load_all()
+
+    assert batch_sizes(graph, ARTWORK_QUERIES["upsert"]) == [2, 2, 1]
+    assert batch_sizes(graph, LEVEL_QUERIES["upsert"]) == [4, 4, 2]
+    steps = {step["step"]: (step["rows"], step["batches"]) for step in loader.report}
+    assert steps["Artwork"] == (5, 3)
+    assert steps["Subject"] == (3, 1)
+    assert steps["HAS_LEVEL"] == (10, 3)
+
+
+def test_schema_statements_are_issued_once(csv_dir):
+    graph = DryRunGraph()
+    GraphLoader(graph, csv_dir=csv_dir).load_all()
+
+    issued = [statement for statement, _ in graph.statements]
+    for statement in CONSTRAINTS + [vector_index_statement()]:
+        assert issued.count(statement) == 1
+
+
+def test_only_new_skips_existing_artworks(csv_dir):
+    graph = DryRunGraph(existing_ids=["1", "2"])
+    loader = GraphLoader(graph, csv_dir=csv_dir, only_new=True)
+    loader.load_all(create_schema=False)
+
+    steps = {step["step"]: step["rows"] for step in loader.report}
+    assert steps["Artwork"] == 3
+    assert steps["BELONGS_TO_CATEGORY"] == 3
+    assert steps["HAS_LEVEL"] == 6
+    # nodes other than artworks are still upserted in full
+    assert steps["Category"] == 2
+    assert [statement for statement, _ in graph.statements].count(EXISTING_ARTWORKS_QUERY) == 1
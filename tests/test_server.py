@@ -0,0 +1,172 @@
+import base64
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import types
+import urllib.request
+
+import pytest
+
+# server.py calls load_dotenv() at import time; python-dotenv is optional here
+sys.modules.setdefault("dotenv", types.SimpleNamespace(load_dotenv=lambda: None))
+
+import server
+from galleryclient import GalleryClient, ServerBusy
+
+
+class Pipeline:
+    """Stand-ins for get_response_languageOnly / get_response_forImage."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+        self.closed = threading.Event()
+        self.uploads = []
+
+    def text(self, prompt, on_stage=None):
+        on_stage("query_graph")
+        self.release.wait(5)
+        try:
+            yield "answer to "
+            yield prompt
+        finally:
+            self.closed.set()
+
+    def image(self, image_path, prompt, on_stage=None):
+        self.uploads.append(image_path)
+        assert os.path.exists(image_path)
+        yield f"{os.path.getsize(image_path)} bytes"
+
+    def endless(self, prompt, on_stage=None):
+        # bounded so a regression fails the test instead of hanging the run
+        deadline = time.monotonic() + 10
+        try:
+            while time.monotonic() < deadline:
+                time.sleep(0.02)
+                yield "."
+        finally:
+            self.closed.set()
+
+
+@pytest.fixture
+def pipeline():
+    return Pipeline()
+
+
+def start(pipeline, workers=2, queue_size=2, text_fn=None):
+    pool = server.WorkerPool(workers, queue_size)
+    httpd = server.GalleryServer(("127.0.0.1", 0), pool, text_fn=text_fn or pipeline.text, image_fn=pipeline.image)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+@pytest.fixture
+def running(pipeline):
+    servers = []
+
+    def run(**kwargs):
+        httpd, base_url = start(pipeline, **kwargs)
+        servers.append(httpd)
+        return httpd, base_url
+
+    yield run
+    pipeline.release.set()
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+        httpd.pool.shutdown()
+
+
+def post(base_url, path, payload):
+    request = urllib.request.Request(base_url + path, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(request, timeout=10) as resp:
+        return resp.status, resp.headers, resp.read()
+
+
+def test_healthz(running):
+    _, base_url = running(workers=3, queue_size=1)
+    health = GalleryClient(base_url, timeout=5).health()
+    assert health == {"status": "ok", "workers": 3, "running": 0, "queued": 0, "capacity": 4}
+
+
+def test_streams_ndjson_events(running):
+    _, base_url = running()
+    status, headers, body = post(base_url, "/v1/ask", {"prompt": "colour"})
+    assert status == 200
+    assert headers["Content-Type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+    assert events == [{"stage": "query_graph"}, {"token": "answer to "}, {"token": "colour"}, {"done": True}]
+
+    stages = []
+    client = GalleryClient(base_url, timeout=5)
+    assert "".join(client.ask("light", on_stage=stages.append)) == "answer to light"
+    assert stages == ["query_graph"]
+
+
+def test_non_stream_returns_whole_answer(running):
+    _, base_url = running()
+    status, headers, body = post(base_url, "/v1/ask", {"prompt": "colour", "stream": False})
+    payload = json.loads(body)
+    assert status == 200
+    assert payload["answer"] == "answer to colour"
+    assert payload["request_id"] == headers["X-Request-ID"]
+
+
+def test_rejects_with_503_when_pool_is_full(running, pipeline):
+    httpd, base_url = running(workers=1, queue_size=0)
+    pipeline.release.clear()
+    first = threading.Thread(target=post, args=(base_url, "/v1/ask", {"prompt": "slow"}), daemon=True)
+    first.start()
+    deadline = time.monotonic() + 5
+    while httpd.pool.stats()["running"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    with pytest.raises(ServerBusy) as busy:
+        list(GalleryClient(base_url, timeout=5).ask("fast"))
+    assert busy.value.retry_after == "1"
+
+    pipeline.release.set()
+    first.join(5)
+    assert "".join(GalleryClient(base_url, timeout=5).ask("fast")) == "answer to fast"
+
+
+def test_uploaded_image_is_removed(running, pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    _, base_url = running()
+    image = base64.b64encode(b"\xff\xd8fake jpeg").decode("ascii")
+    status, _, body = post(base_url, "/v1/critique",
+                           {"prompt": "critique", "image": image, "filename": "a.png", "stream": False})
+    assert status == 200
+    assert json.loads(body)["answer"] == "11 bytes"
+    assert pipeline.uploads and pipeline.uploads[0].endswith(".png")
+    assert os.listdir(tmp_path / "uploads") == []
+
+
+def test_non_stream_client_disconnect_stops_generation(running, pipeline):
+    httpd, base_url = running(text_fn=pipeline.endless)
+    body = json.dumps({"prompt": "forever", "stream": False}).encode("utf-8")
+    with socket.create_connection(httpd.server_address[:2], timeout=5) as sock:
+        sock.sendall(b"POST /v1/ask HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\n"
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+        time.sleep(0.2)
+    assert pipeline.closed.wait(5)
+
+
+def test_reload_drops_graph_caches(running, monkeypatch):
+    from tools.load_graph import reload_server
+
+    calls = []
+    cypher_cache = server.CypherCache()
+    cypher_cache.store("how many artworks", "MATCH (a:Artwork) RETURN count(a)")
+    monkeypatch.setattr(server, "invalidateCache", lambda: calls.append(True))
+    monkeypatch.setattr(server, "get_cypher_cache", lambda: cypher_cache)
+    _, base_url = running()
+    status, _, body = post(base_url, "/v1/admin/reload", {})
+    assert (status, json.loads(body)) == (200, {"status": "ok"})
+    assert len(cypher_cache) == 0
+    assert reload_server(base_url)
+    assert len(calls) == 2
@@ -0,0 +1,49 @@
+import os
+import shutil
+
+import pytest
+
+import thumbpack
+from thumbpack import ThumbPack, build_thumbpack, get_thumbpack
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    shutil.copy(os.path.join(REPO_ROOT, "test.jpg"), directory / "a.jpg")
+    shutil.copy(os.path.join(REPO_ROOT, "test1.jpg"), directory / "b.jpg")
+    return str(directory)
+
+
+def test_round_trip(image_dir, tmp_path):
+    pack_path = str(tmp_path / "thumbs.pack")
+    build_thumbpack(image_dir, pack_path)
+    pack = ThumbPack(pack_path)
+    assert "a.jpg" in pack and "b.jpg" in pack
+    assert pack.get("a.jpg").startswith("data:image/webp;base64,")
+    assert max(pack.size("b.jpg")) <= 768
+    assert pack.get("missing.jpg") is None
+
+
+def test_pack_paired_with_a_stale_index_is_rejected(image_dir, tmp_path):
+    pack_path = str(tmp_path / "thumbs.pack")
+    build_thumbpack(image_dir, pack_path)
+    old_index = open(pack_path + ".index.json").read()
+    # Crash after the new pack was swapped in but before its index was
+    build_thumbpack(image_dir, pack_path, filenames=["b.jpg"])
+    with open(pack_path + ".index.json", "w") as f:
+        f.write(old_index)
+    with pytest.raises(ValueError):
+        ThumbPack(pack_path)
+
+
+def test_get_thumbpack_picks_up_a_pack_built_later(image_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbpack, "_packs", {})
+    pack_path = str(tmp_path / "thumbs.pack")
+    assert get_thumbpack(pack_path) is None
+    build_thumbpack(image_dir, pack_path)
+    pack = get_thumbpack(pack_path)
+    assert pack is not None and get_thumbpack(pack_path) is pack
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from embedstore import EmbeddingStore, write_store
+from vectorsearch import ExactIndex, IVFIndex
+
+
+def make_store(tmp_path, n, valid=None, dim=4, seed=0):
+    embeddings = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    write_store(str(tmp_path), [str(i) for i in range(n)], [f"{i}.jpg" for i in range(n)], embeddings, valid=valid)
+    return EmbeddingStore(str(tmp_path)), embeddings
+
+
+def test_ivf_matches_exact_with_all_lists_probed(tmp_path):
+    store, embeddings = make_store(tmp_path, 64)
+    ivf = IVFIndex(store, nlist=8, nprobe=8)
+    assert ivf.exact is None
+    assert ivf.search_batch(embeddings[:5], k=3) == ExactIndex(store).search_batch(embeddings[:5], k=3)
+
+
+@pytest.mark.parametrize("kwargs", [{"nlist": 8}, {"centroids": np.eye(8, 4, dtype=np.float32)}])
+def test_ivf_falls_back_to_exact_with_fewer_rows_than_lists(tmp_path, kwargs):
+    store, embeddings = make_store(tmp_path, 5)
+    ivf = IVFIndex(store, **kwargs)
+    assert ivf.exact is not None
+    assert ivf.search(embeddings[2], k=1) == ["2.jpg"]
+
+
+def test_ivf_without_valid_rows_returns_nothing(tmp_path):
+    store, embeddings = make_store(tmp_path, 3, valid=[False, False, False])
+    ivf = IVFIndex(store)
+    assert len(ivf) == 0
+    assert ivf.search_batch(embeddings[:2], k=2) == [[], []]
@@ -0,0 +1,51 @@
+import base64
+import io
+import os
+import shutil
+
+import pytest
+from PIL import Image
+
+import vllm
+from thumbpack import ThumbPack, build_thumbpack
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sent_image(part):
+    header, data = part["image_url"]["url"].split(",", 1)
+    return header, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+@pytest.fixture
+def pack(tmp_path, monkeypatch):
+    def make(**kwargs):
+        image_dir = tmp_path / "images"
+        image_dir.mkdir(exist_ok=True)
+        shutil.copy(os.path.join(REPO_ROOT, "test.jpg"), image_dir / "ref.jpg")
+        build_thumbpack(str(image_dir), str(tmp_path / "thumbs.pack"), **kwargs)
+        thumbs = ThumbPack(str(tmp_path / "thumbs.pack"))
+        monkeypatch.setattr(vllm, "get_thumbpack", lambda path: thumbs)
+        return thumbs
+    return make
+
+
+@pytest.mark.parametrize("target_tokens", [0, 1000, 1450])
+def test_sent_reference_matches_its_plan(pack, target_tokens):
+    thumbs = pack()
+    [(_, part, plan)] = vllm.encode_reference_images(["ref.jpg"], {"tokens": target_tokens})
+    header, img = sent_image(part)
+    assert img.size == tuple(plan["size"])
+    assert header.startswith(f"data:image/{plan['format'].lower()};")
+    assert plan["tokens"] == vllm.estimate_image_tokens(*img.size, plan["detail"])
+    if target_tokens == 0:
+        # not downgraded: the pack entry is sent as-is
+        assert part["image_url"]["url"] == thumbs.get("ref.jpg")
+
+
+def test_jpeg_pack_is_reencoded_to_the_planned_codec(pack):
+    thumbs = pack(img_format="JPEG", quality=85)
+    [(_, part, plan)] = vllm.encode_reference_images(["ref.jpg"])
+    header, img = sent_image(part)
+    assert part["image_url"]["url"] != thumbs.get("ref.jpg")
+    assert header.startswith("data:image/webp;") and img.size == tuple(plan["size"])
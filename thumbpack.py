@@ -0,0 +1,155 @@
+import base64
+import io
+import json
+import mmap
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# 打包文件结构：
+#   thumbs.pack             所有缩略图的data URL（ASCII）首尾相接，末尾是本次生成的stamp
+#   thumbs.pack.index.json  {filename: [offset, length, width, height]}，以及数据字节数和stamp，
+#                           打开时校验，避免新的pack配上旧的（或写了一半的）索引而取错图片
+# 请求时直接按偏移量从mmap中切出data URL，无需解码、缩放或重新编码
+
+# 默认与vllm.py中参考图片的编码方案（ROLE_CODECS["reference"]，最长边768）一致，
+# 这样未被降级的参考图片可以原样发送
+THUMB_FORMAT = "WEBP"
+THUMB_QUALITY = 75
+
+
+def encode_thumbnail(image_path, max_size=(768, 768), quality=THUMB_QUALITY, img_format=THUMB_FORMAT):
+    """把图片缩放并编码为data URL，返回(data_url, width, height)"""
+    img = Image.open(image_path)
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    if img.mode in ("RGBA", "LA", "P"):
+        # 透明背景铺白
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", img.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format=img_format, quality=quality)
+    data_url = f"data:image/{img_format.lower()};base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+    return data_url, img.width, img.height
+
+
+def build_thumbpack(image_dir, pack_path, filenames=None, max_size=(768, 768), quality=THUMB_QUALITY,
+                    num_workers=4, img_format=THUMB_FORMAT):
+    """为整个作品库生成可直接发送给API的缩略图打包文件"""
+    if filenames is None:
+        filenames = sorted(
+            f for f in os.listdir(image_dir) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+        )
+
+    def encode(filename):
+        try:
+            return filename, encode_thumbnail(os.path.join(image_dir, filename), max_size, quality, img_format)
+        except Exception as e:
+            print(f"处理图片失败 {filename}: {str(e)}")
+            return filename, None
+
+    index = {}
+    offset = 0
+    stamp = uuid.uuid4().hex
+    tmp = pack_path + ".tmp"
+    with open(tmp, "wb") as f, ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for filename, result in executor.map(encode, filenames):
+            if result is None:
+                continue
+            data_url, width, height = result
+            data = data_url.encode("ascii")
+            f.write(data)
+            index[filename] = [offset, len(data), width, height]
+            offset += len(data)
+        f.write(stamp.encode("ascii"))
+    index_path = pack_path + ".index.json"
+    with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"max_size": list(max_size), "format": img_format, "quality": quality,
+                   "pack_bytes": offset, "stamp": stamp, "entries": index}, f)
+    # 两个文件都完整写出后再依次替换；中途失败时stamp不匹配，打开时会报错而不是返回错误的图片
+    os.replace(tmp, pack_path)
+    os.replace(index_path + ".tmp", index_path)
+    print(f"已打包 {len(index)}/{len(filenames)} 张缩略图，共 {offset / 2**20:.1f} MB: {pack_path}")
+
+
+class ThumbPack:
+    """只读访问缩略图打包文件（mmap）"""
+
+    def __init__(self, pack_path):
+        with open(pack_path + ".index.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.entries = meta["entries"]
+        self.max_size = tuple(meta["max_size"])
+        # 旧的打包文件没有记录格式，当时只生成JPEG
+        self.format = meta.get("format", "JPEG")
+        self._file = open(pack_path, "rb")
+        # 旧的打包文件没有记录stamp，无法校验
+        stamp = meta.get("stamp")
+        if stamp is not None:
+            self._file.seek(meta["pack_bytes"])
+            matches = (os.fstat(self._file.fileno()).st_size == meta["pack_bytes"] + len(stamp)
+                       and self._file.read(len(stamp)) == stamp.encode("ascii"))
+            if not matches:
+                self._file.close()
+                raise ValueError(f"缩略图打包文件与索引不匹配，请重新生成: {pack_path}")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.entries else None
+
+    def __contains__(self, filename):
+        return filename in self.entries
+
+    def get(self, filename):
+        """返回data URL字符串，不存在时返回None"""
+        entry = self.entries.get(filename)
+        if entry is None:
+            return None
+        offset, length = entry[0], entry[1]
+        return self._mmap[offset:offset + length].decode("ascii")
+
+    def size(self, filename):
+        entry = self.entries.get(filename)
+        return (entry[2], entry[3]) if entry else None
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+_packs = {}
+_lock = threading.Lock()
+
+
+def get_thumbpack(pack_path):
+    """进程内缓存打开的打包文件；文件不存在或损坏时返回None（不缓存，之后生成的打包文件会被用上）"""
+    key = os.path.abspath(pack_path)
+    with _lock:
+        if key not in _packs:
+            if not os.path.exists(pack_path):
+                return None
+            try:
+                _packs[key] = ThumbPack(pack_path)
+            except (OSError, ValueError) as e:
+                print(f"无法打开缩略图打包文件，回退到实时编码: {e}")
+                return None
+        return _packs[key]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="为作品库预生成API可直接使用的缩略图打包文件")
+    parser.add_argument("--image-dir", default="images")
+    parser.add_argument("--output", default="thumbs.pack")
+    parser.add_argument("--max-size", type=int, default=768)
+    parser.add_argument("--format", default=THUMB_FORMAT, choices=["WEBP", "JPEG"])
+    parser.add_argument("--quality", type=int, default=THUMB_QUALITY)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    build_thumbpack(args.image_dir, args.output, max_size=(args.max_size, args.max_size),
+                    quality=args.quality, num_workers=args.workers, img_format=args.format)
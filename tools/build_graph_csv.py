@@ -0,0 +1,159 @@
+import argparse
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Single-pass replacement for dividecategory.py -> score_to_text.py -> convert_to_dimension.py:
+# streams APDD_enriched.csv in chunks and writes every graph CSV directly, with no
+# intermediate files and memory bounded by the chunk size.
+
+DIMENSIONS: List[str] = [
+    "theme_and_logic",
+    "creativity",
+    "layout_and_composition",
+    "space_and_perspective",
+    "sense_of_order",
+    "light_and_shadow",
+    "color",
+    "details_and_texture",
+    "overall",
+    "mood",
+]
+REASON_COLUMNS: List[str] = [f"reason_for_{d}" for d in DIMENSIONS]
+
+# Same bins as score_to_text.score_to_description: [lower, upper) per level
+LEVEL_BINS = [-np.inf, 2, 3, 4, 5, 6, 7, 8, 9, np.inf]
+LEVEL_LABELS = np.array([
+    "Abysmal", "Horrendous", "Poor", "Below Average", "Average",
+    "Good", "Very Good", "Excellent", "Outstanding",
+], dtype=object)
+
+# artistic_categories is "category*style*subject"; each part becomes a node type
+CATEGORY_PARTS = [
+    # (output file, column, node file, node label, relationship type)
+    ("Artwork_Category.csv", "category", "Category.csv", "Category", "BELONGS_TO_CATEGORY"),
+    ("Artwork_STYLE.csv", "style", "Artstyle.csv", "Artstyle", "BELONGS_TO_STYLE"),
+    ("Artwork_Subject.csv", "subject", "Subject.csv", "Subject", "BELONGS_TO_SUBJECT"),
+]
+
+
+def split_categories(categories: pd.Series) -> pd.DataFrame:
+    """'traditional Chinese painting*meticulous*mountains and water' -> normalized node ids per part."""
+    parts = categories.astype("string").str.split("*", n=2, expand=True).reindex(columns=range(3))
+    parts = parts.apply(lambda s: s.str.strip().str.lower().str.replace(r"\s+", "_", regex=True))
+    parts.columns = [column for _, column, _, _, _ in CATEGORY_PARTS]
+    return parts.replace("", pd.NA)
+
+
+def score_levels(scores: pd.DataFrame) -> np.ndarray:
+    """Numeric scores (n, d) -> level labels (n, d), None where the score is missing or not numeric."""
+    values = scores.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    bins = np.digitize(values, LEVEL_BINS[1:-1])
+    levels = LEVEL_LABELS[np.minimum(bins, len(LEVEL_LABELS) - 1)]
+    levels[np.isnan(values)] = None
+    return levels
+
+
+def melt_levels(ids: np.ndarray, levels: np.ndarray, reasons: pd.DataFrame) -> pd.DataFrame:
+    """Wide (one row per artwork) -> long HAS_LEVEL rows, artwork-major in DIMENSIONS order."""
+    n, d = levels.shape
+    # Double quotes are dropped from reasons (as in the existing csv/ files): the source
+    # has stray unbalanced quotes that break LOAD CSV
+    reason_values = (
+        reasons.astype("string")
+        .apply(lambda s: s.str.replace('"', "", regex=False).str.strip())
+        .fillna("")
+        .to_numpy(dtype=object)
+    )
+    keep = pd.notna(levels).ravel()
+    return pd.DataFrame({
+        "artwork": np.repeat(ids, d)[keep],
+        "dimension": np.tile(np.array(DIMENSIONS, dtype=object), n)[keep],
+        "level": levels.ravel()[keep],
+        "reason": reason_values.ravel()[keep],
+        ":TYPE": "HAS_LEVEL",
+    })
+
+
+class CsvSink:
+    """Appends DataFrames to one output CSV, writing the header only once."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame):
+        df.to_csv(self.path, mode="a" if self.rows else "w", header=not self.rows, index=False, encoding="utf-8")
+        self.rows += len(df)
+
+
+def build_graph_csv(input_csv_path: str, output_dir: str, chunksize: int = 2000) -> Dict[str, int]:
+    """
+    Stream APDD_enriched.csv and write the graph CSVs into output_dir:
+    Artwork, Artwork_Category, Artwork_STYLE, Artwork_Subject, Artwork_DIMENSION,
+    plus the Category/Artstyle/Subject/AestheticDimension node files.
+
+    Artwork ids are 1-based row numbers of the input, as in the existing csv/ files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    artworks = CsvSink(os.path.join(output_dir, "Artwork.csv"))
+    levels_sink = CsvSink(os.path.join(output_dir, "Artwork_DIMENSION.csv"))
+    part_sinks = {column: CsvSink(os.path.join(output_dir, out)) for out, column, _, _, _ in CATEGORY_PARTS}
+    # Distinct node ids in first-seen order; these sets stay tiny regardless of input size
+    node_ids: Dict[str, Dict[str, None]] = {column: {} for _, column, _, _, _ in CATEGORY_PARTS}
+
+    next_id = 1
+    reader = pd.read_csv(input_csv_path, chunksize=chunksize, dtype={"filename": str, "artistic_categories": str})
+    for chunk in reader:
+        missing = [c for c in ["filename", "artistic_categories"] + DIMENSIONS + REASON_COLUMNS if c not in chunk.columns]
+        if missing:
+            raise ValueError(f"Columns not found in {input_csv_path}: {missing}")
+        ids = np.arange(next_id, next_id + len(chunk))
+        next_id += len(chunk)
+
+        artworks.write(pd.DataFrame({"id": ids, "filename": chunk["filename"].to_numpy(), "embedding": "", ":LABEL": "Artwork"}))
+
+        parts = split_categories(chunk["artistic_categories"])
+        for _, column, _, _, rel in CATEGORY_PARTS:
+            values = parts[column]
+            present = values.notna().to_numpy()
+            part_sinks[column].write(pd.DataFrame({"artwork": ids[present], column: values[present].to_numpy(), ":TYPE": rel}))
+            node_ids[column].update(dict.fromkeys(values[present].unique()))
+
+        levels = score_levels(chunk[DIMENSIONS])
+        levels_sink.write(melt_levels(ids, levels, chunk[REASON_COLUMNS]))
+
+    counts = {"Artwork.csv": artworks.rows, "Artwork_DIMENSION.csv": levels_sink.rows}
+    for out, column, node_file, label, _ in CATEGORY_PARTS:
+        counts[out] = part_sinks[column].rows
+        pd.DataFrame({"id": list(node_ids[column]), ":LABEL": label}).to_csv(
+            os.path.join(output_dir, node_file), index=False, encoding="utf-8")
+        counts[node_file] = len(node_ids[column])
+    pd.DataFrame({"id": DIMENSIONS, ":LABEL": "AestheticDimension"}).to_csv(
+        os.path.join(output_dir, "AestheticDimension.csv"), index=False, encoding="utf-8")
+    counts["AestheticDimension.csv"] = len(DIMENSIONS)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build all graph CSVs from APDD_enriched.csv in one chunked pass")
+    parser.add_argument("--input", default="csv/APDD_enriched.csv")
+    parser.add_argument("--output-dir", default="csv")
+    parser.add_argument("--chunksize", type=int, default=2000, help="input rows per chunk")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        parser.error(f"Input file '{args.input}' not found")
+    start = time.perf_counter()
+    counts = build_graph_csv(args.input, args.output_dir, args.chunksize)
+    elapsed = time.perf_counter() - start
+    for name, rows in counts.items():
+        print(f"  {name}: {rows} rows")
+    print(f"Done in {elapsed:.2f}s ({counts['Artwork.csv'] / elapsed:,.0f} artworks/sec), output in {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
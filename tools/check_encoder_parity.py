@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clipencoder import BACKENDS, create_encoder
+from embedstore import EmbeddingStore
+from vectorsearch import ExactIndex
+
+
+def check_parity(store_path, image_dir, backend, sample_size=200, k=10, batch_size=32, seed=0):
+    """
+    Compare a candidate CLIP backend against the float32 embeddings in the store.
+
+    For a random sample of stored artworks, re-encode the image with the candidate
+    backend and report:
+    - cosine agreement between the new and the stored embedding (mean / p5 / min)
+    - top-k retrieval overlap: |topk(stored query) ∩ topk(candidate query)| / k
+    - encoder throughput in images/sec
+    """
+    store = EmbeddingStore(store_path)
+    index = ExactIndex(store)
+    rng = np.random.default_rng(seed)
+    rows = np.flatnonzero(np.asarray(store.valid))
+    rows = rng.choice(rows, size=min(sample_size, len(rows)), replace=False)
+
+    encoder = create_encoder(backend)
+    reference, candidate = [], []
+    encode_time = 0.0
+    for start in range(0, len(rows), batch_size):
+        batch_rows = rows[start:start + batch_size]
+        images = []
+        for row in batch_rows:
+            try:
+                images.append(Image.open(os.path.join(image_dir, store.filenames[row])).convert("RGB"))
+            except Exception as e:
+                print(f"Skipping {store.filenames[row]}: {e}")
+                images.append(None)
+        keep = [i for i, img in enumerate(images) if img is not None]
+        if not keep:
+            continue
+        pixel_values = encoder.preprocess([images[i] for i in keep])
+        t0 = time.perf_counter()
+        candidate.append(encoder.encode(pixel_values))
+        encode_time += time.perf_counter() - t0
+        reference.append(np.asarray(store.matrix[batch_rows[keep]], dtype=np.float32))
+
+    if not candidate:
+        raise ValueError("No images could be loaded for the parity check")
+    reference = np.concatenate(reference)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = np.concatenate(candidate)
+
+    cosine = np.sum(reference * candidate, axis=1)
+    truth = index.search_batch(reference, k)
+    approx = index.search_batch(candidate, k)
+    overlap = np.array([len(set(a) & set(t)) / k for a, t in zip(approx, truth)])
+
+    report = {
+        "backend": backend,
+        "samples": len(cosine),
+        "cosine_mean": float(cosine.mean()),
+        "cosine_p5": float(np.percentile(cosine, 5)),
+        "cosine_min": float(cosine.min()),
+        f"top{k}_overlap": float(overlap.mean()),
+        "images_per_sec": len(cosine) / encode_time if encode_time > 0 else float("inf"),
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check a CLIP backend against the stored float32 embeddings")
+    parser.add_argument("--store", default="embeddings")
+    parser.add_argument("--image-dir", default="images")
+    parser.add_argument("--backend", default="int8", choices=BACKENDS)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    report = check_parity(args.store, args.image_dir, args.backend, args.samples, args.k, args.batch_size)
+    for key, value in report.items():
+        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
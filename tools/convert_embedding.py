@@ -1,8 +1,19 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 import torch
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clipencoder import BACKENDS, create_encoder
+from embedstore import EmbeddingStoreWriter
+
 def embed_images_from_csv(csv_path, output_csv_path):
     """
     读取CSV中的图片路径，生成嵌入向量，保存到新列中
@@ -38,7 +49,7 @@ def embed_images_from_csv(csv_path, output_csv_path):
             image = Image.open("images/"+img_path).convert("RGB")  # 确保图片是RGB格式
             
             # 预处理图片（归一化、resize等）
-            inputs = processor(images=image, retimagesurn_tensors="pt").to(device)
+            inputs = processor(images=image, return_tensors="pt").to(device)
             
             # 生成嵌入向量（CLIP的图片编码器输出）
             with torch.no_grad():  # 关闭梯度计算，加速推理
@@ -60,14 +71,114 @@ def embed_images_from_csv(csv_path, output_csv_path):
     df.to_csv(output_csv_path, index=False)
     print(f"处理完成，结果已保存到: {output_csv_path}")
 
+def _load_pixel_values(encoder, image_dir, img_path):
+    """在工作线程中解码并预处理单张图片，失败时返回None"""
+    try:
+        image = Image.open(os.path.join(image_dir, img_path)).convert("RGB")
+        return encoder.preprocess([image])[0]
+    except Exception as e:
+        print(f"处理图片失败 {img_path}: {str(e)}")
+        return None
+
+def embed_images_batched(csv_path, output_path, image_dir="images", batch_size=32, num_workers=4,
+                         output_format="store", dtype="float32", backend="torch"):
+    """
+    批量并行生成嵌入向量：线程池并行解码+预处理，按固定batch送入CLIP视觉编码器，
+    每个batch完成后立即写出，并打印吞吐（images/sec）
+
+    参数：
+        csv_path: 输入CSV文件路径（包含id、filename列）
+        output_path: 输出路径，output_format为"store"时是向量存储目录，为"csv"时是CSV文件
+        image_dir: 图片所在目录
+        batch_size: 每次前向计算的图片数量
+        num_workers: 解码/预处理的线程数
+        output_format: "store"写入二进制向量存储（见embedstore.py），"csv"写入embedding列
+        dtype: 向量存储的精度，float32或float16
+        backend: CLIP编码后端（见clipencoder.py）：torch、int8、onnx、onnx-int8
+    """
+    df = pd.read_csv(csv_path, dtype={"id": str})
+    if "filename" not in df.columns:
+        raise ValueError("CSV文件必须包含'filename'列，存储图片本地路径")
+
+    # 确保使用GPU（如果可用），否则用CPU
+    encoder = create_encoder(backend, device="cuda" if torch.cuda.is_available() else "cpu")
+
+    filenames = df["filename"].tolist()
+    batches = [range(i, min(i + batch_size, len(filenames))) for i in range(0, len(filenames), batch_size)]
+
+    store = None
+    if output_format == "store":
+        ids = df["id"].tolist() if "id" in df.columns else [str(i + 1) for i in range(len(df))]
+        store = EmbeddingStoreWriter(output_path, ids, filenames, dim=encoder.dim, dtype=dtype)
+    else:
+        # 先写入临时文件，全部完成后再替换：输出路径与输入相同时不会覆盖尚未读完的输入，
+        # 中断时已完成的batch留在临时文件中，原文件保持不变
+        tmp_path = output_path + ".tmp"
+
+    done = 0
+    failed = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            def submit(rows):
+                return [executor.submit(_load_pixel_values, encoder, image_dir, filenames[i]) for i in rows]
+
+            # 预取下一个batch，使图片解码与模型前向计算重叠，同时限制内存中的batch数量
+            pending = submit(batches[0]) if batches else []
+            for b, rows in enumerate(batches):
+                pixel_values = [f.result() for f in pending]
+                pending = submit(batches[b + 1]) if b + 1 < len(batches) else []
+
+                ok = [j for j, p in enumerate(pixel_values) if p is not None]
+                embeddings = np.zeros((len(rows), encoder.dim), dtype=np.float32)
+                if ok:
+                    embeddings[ok] = encoder.encode(np.stack([pixel_values[j] for j in ok]))
+                valid = [p is not None for p in pixel_values]
+
+                # 每个batch完成即写出，中途中断也能保留已完成的结果
+                if store is not None:
+                    store.write(rows.start, embeddings, valid)
+                else:
+                    chunk = df.iloc[rows.start:rows.stop].copy()
+                    chunk["embedding"] = [e.tolist() if v else None for e, v in zip(embeddings, valid)]
+                    chunk.to_csv(tmp_path, mode="w" if b == 0 else "a", header=(b == 0), index=False)
+
+                done += len(rows)
+                failed += len(rows) - len(ok)
+                elapsed = time.perf_counter() - start
+                print(f"已处理 {done}/{len(filenames)} 张图片，失败 {failed}，{done / elapsed:.1f} images/sec")
+    finally:
+        # 出错或中断时也关闭存储，已写入的batch保持有效
+        if store is not None:
+            store.close()
+    if store is None and batches:
+        os.replace(tmp_path, output_path)
+    elapsed = time.perf_counter() - start
+    print(f"处理完成，共 {done} 张图片，用时 {elapsed:.1f}s（{done / max(elapsed, 1e-9):.1f} images/sec），结果已保存到: {output_path}")
+
 # --------------------------
 # 使用示例
 # --------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为Artwork.csv中的图片生成CLIP嵌入向量")
     # 输入CSV路径
-    input_csv = "Artwork.csv"
-    # 输出CSV路径（保存带嵌入向量的表格）
-    output_csv = "Artwork.csv"
+    parser.add_argument("--input", default="Artwork.csv")
+    # 输出路径：默认写入二进制向量存储，需要neo4j导入CSV时用 embedstore.py export 导出
+    parser.add_argument("--output", default="embeddings")
+    parser.add_argument("--format", default="store", choices=["store", "csv"])
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--image-dir", default="images")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backend", default="torch", choices=BACKENDS, help="CLIP编码后端")
+    parser.add_argument("--serial", action="store_true", help="使用逐张处理的旧流程")
+    args = parser.parse_args()
     
     # 执行处理
-    embed_images_from_csv(input_csv, output_csv)
\ No newline at end of file
+    if args.serial:
+        if args.format != "csv":
+            parser.error("--serial 只支持 --format csv")
+        embed_images_from_csv(args.input, args.output)
+    else:
+        embed_images_batched(args.input, args.output, args.image_dir, args.batch_size, args.workers,
+                             args.format, args.dtype, args.backend)
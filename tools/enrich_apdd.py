@@ -1,9 +1,18 @@
-import os
+import argparse
 import json
+import os
+import random
+import sys
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
 import pandas as pd
-from typing import Dict, Any, List
-from openai import OpenAI
+from openai import APIConnectionError, APITimeoutError, InternalServerError, OpenAI, RateLimitError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llmcache import LLMCache, cached_completion
 
 # Optional .env support (matches llm.py behavior)
 try:
@@ -13,13 +22,8 @@ except Exception:
     pass
 
 API_KEY = os.getenv("DEEPSEEK_API_KEY") or os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise RuntimeError(
-        "Missing API key. Set DEEPSEEK_API_KEY or OPENAI_API_KEY in your environment or .env"
-    )
-
-BASE_URL = "https://api.deepseek.com"
-MODEL = "deepseek-chat"
+BASE_URL = os.getenv("ENRICH_BASE_URL", "https://api.deepseek.com")
+MODEL = os.getenv("ENRICH_MODEL", "deepseek-chat")
 
 REASON_FIELDS: List[str] = [
     "reason_for_theme_and_logic",
@@ -34,22 +38,81 @@ REASON_FIELDS: List[str] = [
     "reason_for_mood",
 ]
 
+# Errors worth retrying: rate limits, timeouts, dropped connections and 5xx
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
 
-def create_client() -> OpenAI:
-    return OpenAI(api_key=API_KEY, base_url=BASE_URL)
+# Appended to the prompt when several comments are packed into one request (batch_size > 1)
+PACKED_INSTRUCTIONS = """
+The comment above contains {n} separate comments, labelled [1] to [{n}]. Handle each one independently, following the instructions above.
+Return a JSON object of the form {{"results": [...]}} whose list holds exactly {n} objects in label order, each in the JSON format described above.
+""".strip()
 
+# 修复后的提示词模板 - 使用三引号避免转义问题
+PROMPT_TEMPLATE = '''
+Comment: {comment}
 
-def call_model(client: OpenAI, prompt: str) -> Dict[str, Any]:
-    """Call the LLM with a provided prompt that returns a JSON string."""
-    resp = client.chat.completions.create(
-        model=MODEL,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that always responds with valid JSON."},
-            {"role": "user", "content": prompt},
-        ],
-        stream=False,
-    )
-    content = resp.choices[0].message.content if resp and resp.choices else ""
+Please extract short sentences and phrases from the comments that reflect the reasons for the score of a specific aesthetic attribute.
+
+Return the result in the following JSON format:
+{{
+    "reason_for_theme_and_logic": "",
+    "reason_for_creativity": "",
+    "reason_for_layout_and_composition": "",
+    "reason_for_space_and_perspective": "",
+    "reason_for_sense_of_order": "",
+    "reason_for_light_and_shadow": "",
+    "reason_for_color": "",
+    "reason_for_details_and_texture": "",
+    "reason_for_overall": "",
+    "reason_for_mood": ""
+}}
+
+Note: 
+- If no reasons for a certain dimension can be found in the comment, fill in an empty string
+- Do not fabricate information
+- Only use phrases directly from the comment
+
+Here are 10 aesthetic attributes and their interpretations:
+- Theme and Logic: The central idea aligns with the artistic expression, ensuring consistency and appropriateness in composition, layout, and color.
+- Creativity: Innovative qualities that break conventions, including satire, self-deprecation, and allegorical warnings.
+- Layout and Composition: The visual structure and organization of an image, reflecting the underlying logic and essence of its form.
+- Space and Perspective: Layered spatial arrangements and perspective techniques create three-dimensionality and spatial effects.
+- Sense of Order: Visual unity and consistency in morphological, spatial, orientational, and dynamic elements.
+- Light and Shadow: Enhance visual rhythm and realism, decorate space, suggest themes, and segment the image.
+- Color: Evokes emotional atmospheres with a harmonious palette, using contrasts in temperature, brightness, and purity.
+- Details and Texture: Vivid details and delicate textures enhance realism, imbuing life into the image.
+- The Overall: Emphasizes coherence and a clear theme, combining form and spirit in the presentation.
+- Mood: Creates a poetic space blending scenes, reality, and illusion, emphasizing tranquility, emptiness, and spirituality.
+
+example:
+the comment is "Each side of the picture is good, making it a great landscape painting. The brushstrokes are skilled, and the visual effect is realistic"
+the answer should be:
+{{
+    "reason_for_theme_and_logic": "",
+    "reason_for_creativity": "",
+    "reason_for_layout_and_composition": "Each side of the picture is good",
+    "reason_for_space_and_perspective": "",
+    "reason_for_sense_of_order": "",
+    "reason_for_light_and_shadow": "",
+    "reason_for_color": "",
+    "reason_for_details_and_texture": "The brushstrokes are skilled",
+    "reason_for_overall": "making it a great landscape painting",
+    "reason_for_mood": ""
+}}
+'''.strip()
+
+
+def create_client(base_url: Optional[str] = None, api_key: Optional[str] = None) -> OpenAI:
+    api_key = api_key or API_KEY
+    if not api_key:
+        raise RuntimeError(
+            "Missing API key. Set DEEPSEEK_API_KEY or OPENAI_API_KEY in your environment or .env"
+        )
+    # Retries are done by call_with_backoff so that 429s also slow down the shared rate limiter
+    return OpenAI(api_key=api_key, base_url=base_url or BASE_URL, max_retries=0)
+
+
+def parse_json(content: str) -> Dict[str, Any]:
     if not content:
         return {}
     try:
@@ -66,12 +129,123 @@ def call_model(client: OpenAI, prompt: str) -> Dict[str, Any]:
         return {}
 
 
-def enrich_row_with_reasons(row: pd.Series, prompt_template: str, client: OpenAI) -> Dict[str, Any]:
-    """Use the comment from the row to fetch reasons and return a mapping for columns."""
-    comment_text = str(row.get("comment", ""))
-    if not comment_text.strip():
-        return {field: None for field in REASON_FIELDS}
+def model_messages(prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": "You are a helpful assistant that always responds with valid JSON."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def call_model(client: OpenAI, prompt: str, model: Optional[str] = None) -> Dict[str, Any]:
+    """Call the LLM with a provided prompt that returns a JSON string."""
+    return parse_json(cached_completion(client, model or MODEL, model_messages(prompt), stream=False))
 
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter shared by all workers.
+
+    The rate adapts (AIMD): slow_down() halves it after a 429 and can pause
+    everyone for Retry-After seconds; speed_up() wins it back gradually on success.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, min_rate: float = 0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                delay = self.paused_until - now
+                if delay <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def slow_down(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def speed_up(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def call_with_backoff(
+    fn: Callable[[], Any],
+    limiter: Optional[TokenBucket] = None,
+    max_retries: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+) -> Any:
+    """Run fn under the rate limiter, retrying transient errors with exponential backoff and jitter."""
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            result = fn()
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            retry_after = _retry_after(e)
+            delay = retry_after or min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if isinstance(e, RateLimitError) and limiter is not None:
+                limiter.slow_down(retry_after)
+            print(f"{type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            continue
+        if limiter is not None:
+            limiter.speed_up()
+        return result
+
+
+def complete_json(
+    client: OpenAI,
+    prompt: str,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: int = 6,
+    model: Optional[str] = None,
+    cache: Optional[LLMCache] = None,
+) -> Dict[str, Any]:
+    """call_model with the response cache checked first, so cache hits skip the rate limiter entirely."""
+    model = model or MODEL
+    messages = model_messages(prompt)
+    if cache is not None:
+        content = cache.get(model, messages, stream=False)
+        if content is not None:
+            return parse_json(content)
+    content = call_with_backoff(lambda: cached_completion(client, model, messages, stream=False), limiter, max_retries)
+    result = parse_json(content)
+    # Only answers that parsed are cached, so a malformed reply is asked again next run
+    if cache is not None and result:
+        cache.put(model, messages, content, stream=False)
+    return result
+
+
+def format_prompt(row: pd.Series, prompt_template: str, comment_text: str) -> str:
     # Build format context safely
     format_context = {}
     for col in row.index:
@@ -86,13 +260,13 @@ def enrich_row_with_reasons(row: pd.Series, prompt_template: str, client: OpenAI
     format_context["comment"] = comment_text
     
     try:
-        prompt = prompt_template.format(**format_context)
+        return prompt_template.format(**format_context)
     except KeyError as e:
         print(f"Warning: Key error in formatting: {e}. Using raw template.")
-        prompt = prompt_template.replace("{comment}", comment_text)
-    
-    result = call_model(client, prompt)
+        return prompt_template.replace("{comment}", comment_text)
+
 
+def reasons_from_result(result: Dict[str, Any]) -> Dict[str, Any]:
     updates: Dict[str, Any] = {}
     for field in REASON_FIELDS:
         val = result.get(field)
@@ -103,116 +277,289 @@ def enrich_row_with_reasons(row: pd.Series, prompt_template: str, client: OpenAI
     return updates
 
 
+def has_reasons(updates: Dict[str, Any]) -> bool:
+    """False for an answer that failed to parse or had no usable reason; such rows are not journaled."""
+    return any(updates.get(field) is not None for field in REASON_FIELDS)
+
+
+def enrich_row_with_reasons(
+    row: pd.Series,
+    prompt_template: str,
+    client: OpenAI,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: int = 6,
+    model: Optional[str] = None,
+    cache: Optional[LLMCache] = None,
+) -> Dict[str, Any]:
+    """Use the comment from the row to fetch reasons and return a mapping for columns."""
+    comment_text = str(row.get("comment", ""))
+    if not comment_text.strip():
+        return {field: None for field in REASON_FIELDS}
+
+    prompt = format_prompt(row, prompt_template, comment_text)
+    result = complete_json(client, prompt, limiter, max_retries, model, cache)
+    return reasons_from_result(result)
+
+
+def pack_prompt(prompt_template: str, comments: List[str]) -> str:
+    """One prompt for several comments, labelled [1]..[n]; the answer is {"results": [...]} in order."""
+    packed = "".join(f"\n[{i}] {comment}" for i, comment in enumerate(comments, 1))
+    try:
+        prompt = prompt_template.format(comment=packed)
+    except KeyError:
+        prompt = prompt_template.replace("{comment}", packed)
+    return prompt + "\n\n" + PACKED_INSTRUCTIONS.format(n=len(comments))
+
+
+def enrich_batch(
+    rows: List[pd.Series],
+    prompt_template: str,
+    client: OpenAI,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: int = 6,
+    model: Optional[str] = None,
+    cache: Optional[LLMCache] = None,
+) -> List[Dict[str, Any]]:
+    """Enrich several rows with one request; falls back to one request per row if the answer doesn't line up."""
+    if len(rows) == 1:
+        return [enrich_row_with_reasons(rows[0], prompt_template, client, limiter, max_retries, model, cache)]
+
+    prompt = pack_prompt(prompt_template, [str(row.get("comment", "")) for row in rows])
+    result = complete_json(client, prompt, limiter, max_retries, model, cache)
+    items = result.get("results")
+    if not (isinstance(items, list) and len(items) == len(rows) and all(isinstance(x, dict) for x in items)):
+        print(f"Warning: packed answer did not contain {len(rows)} results, retrying rows one by one")
+        items = [{}] * len(rows)
+    updates = [reasons_from_result(x) for x in items]
+    # Rows the packed answer left empty are asked again on their own
+    return [
+        u if has_reasons(u) else enrich_row_with_reasons(row, prompt_template, client, limiter, max_retries, model, cache)
+        for row, u in zip(rows, updates)
+    ]
+
+
+class Journal:
+    """
+    Append-only JSONL journal of per-row results, keyed by filename.
+
+    Each finished batch is appended and fsync'ed, so a crash loses at most the
+    requests in flight; on load the last entry per filename wins and a torn
+    final line is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[record["filename"]] = record["reasons"]
+        return entries
+
+    def append(self, records: List[Tuple[str, Dict[str, Any]]]) -> None:
+        if self._file is None:
+            needs_newline = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+            if needs_newline:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    needs_newline = f.read(1) != b"\n"
+            self._file = open(self.path, "a", encoding="utf-8")
+            if needs_newline:
+                # Terminate a line torn by a crash so the next record starts cleanly
+                self._file.write("\n")
+        for filename, reasons in records:
+            self._file.write(json.dumps({"filename": filename, "reasons": reasons}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def default_journal_path(output_csv_path: str) -> str:
+    return output_csv_path + ".journal.jsonl"
+
+
+def compact_journal(input_csv_path: str, journal_path: str, output_csv_path: str) -> int:
+    """Merge the journal into the input CSV and write the enriched CSV atomically; returns rows filled."""
+    df = pd.read_csv(input_csv_path)
+    for col in REASON_FIELDS:
+        if col not in df.columns:
+            df[col] = None
+        df[col] = df[col].astype(object)
+
+    entries = Journal(journal_path).load()
+    found = df["filename"].map(entries)
+    mask = found.notna()
+    if mask.any():
+        reasons = pd.DataFrame(found[mask].tolist(), index=df.index[mask]).reindex(columns=REASON_FIELDS)
+        df.loc[mask, REASON_FIELDS] = reasons.astype(object).where(reasons.notna(), None)
+
+    tmp_path = output_csv_path + ".tmp"
+    df.to_csv(tmp_path, index=False, encoding="utf-8")
+    os.replace(tmp_path, output_csv_path)
+    return int(mask.sum())
+
+
 def enrich_csv(
     input_csv_path: str,
     output_csv_path: str,
     prompt_template: str,
     batch_size: int = 1,
     rate_limit_sleep_s: float = 0.0,
+    concurrency: int = 8,
+    requests_per_second: Optional[float] = None,
+    max_retries: int = 6,
+    client: Optional[OpenAI] = None,
+    model: Optional[str] = None,
+    journal_path: Optional[str] = None,
+    cache: Optional[LLMCache] = None,
 ) -> None:
-    """Read CSV, call model for each row (optionally batched), and write enriched CSV."""
+    """
+    Read CSV, call the model for every row with a comment, and write the enriched CSV.
+
+    Up to `concurrency` requests are in flight at once, paced by a shared token
+    bucket (`requests_per_second`; `rate_limit_sleep_s` is still accepted and
+    converted to a rate). 429s halve the rate and honour Retry-After. With
+    batch_size > 1, that many comments are packed into each prompt.
+
+    Results are appended to a JSONL journal (default: <output>.journal.jsonl)
+    as they arrive. A rerun skips filenames already in the journal, and the
+    journal is compacted into output_csv_path at the end.
+
+    With a cache (llmcache.LLMCache), byte-identical prompts reuse the stored
+    answer instead of calling the model.
+    """
     if "{comment}" not in prompt_template:
         raise ValueError("prompt_template must contain '{comment}' placeholder")
 
     df = pd.read_csv(input_csv_path)
-    # Ensure all reason columns exist so we can assign by name later
-    for col in REASON_FIELDS:
-        if col not in df.columns:
-            df[col] = None
+    if "filename" not in df.columns:
+        raise ValueError("CSV must contain a 'filename' column to key the journal")
+    journal = Journal(journal_path or default_journal_path(output_csv_path))
+    done = journal.load()
 
-    client = create_client()
+    client = client or create_client()
+    if requests_per_second is None and rate_limit_sleep_s > 0:
+        requests_per_second = 1.0 / rate_limit_sleep_s
+    limiter = TokenBucket(requests_per_second) if requests_per_second else None
+
+    # Skip rows with empty/NaN comment to save tokens
+    comments = df["comment"] if "comment" in df.columns else pd.Series("", index=df.index)
+    has_comment = comments.fillna("").astype(str).str.strip() != ""
+    # Resume: rows already in the journal are done
+    pending = df.index[has_comment & ~df["filename"].isin(list(done))].tolist()
+    batches = [pending[i : i + max(1, batch_size)] for i in range(0, len(pending), max(1, batch_size))]
     total_rows = len(df)
     
-    print(f"Starting to process {total_rows} rows...")
+    if done:
+        print(f"Resuming: {len(done)} rows already in journal {journal.path}")
+    print(f"Starting to process {len(pending)} of {total_rows} rows in {len(batches)} requests "
+          f"(concurrency {concurrency}, {requests_per_second or 'unlimited'} req/s)...")
 
-    for idx in range(total_rows):
-        row = df.iloc[idx]
-        # Skip rows with empty/NaN comment to save tokens
-        comment_val = row.get("comment", "")
-        if (isinstance(comment_val, float) and pd.isna(comment_val)) or (isinstance(comment_val, str) and not comment_val.strip()):
-            continue
+    start = time.perf_counter()
+    processed = failed = 0
+    batch_iter = iter(batches)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Keep a bounded window of submitted batches instead of queueing every row up front
+        in_flight = {}
 
-        print(f"Processing row {idx + 1}/{total_rows}...")
-        updates = enrich_row_with_reasons(row, prompt_template, client)
-        
-        for k, v in updates.items():
-            df.at[row.name, k] = v
-            
-        if rate_limit_sleep_s > 0:
-            time.sleep(rate_limit_sleep_s)
-            
-        # Save progress every 10 rows
-        if (idx + 1) % 10 == 0:
-            df.to_csv(output_csv_path, index=False, encoding="utf-8")
-            print(f"Progress saved at row {idx + 1}")
+        def submit_next() -> bool:
+            batch = next(batch_iter, None)
+            if batch is None:
+                return False
+            rows = [df.loc[i] for i in batch]
+            future = executor.submit(enrich_batch, rows, prompt_template, client, limiter, max_retries, model, cache)
+            in_flight[future] = batch
+            return True
 
-    df.to_csv(output_csv_path, index=False, encoding="utf-8")
-    print(f"Completed processing {total_rows} rows.")
+        for _ in range(concurrency * 2):
+            if not submit_next():
+                break
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                batch = in_flight.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    failed += len(batch)
+                    print(f"Failed rows {batch}: {type(e).__name__}: {e}")
+                else:
+                    # Failed rows (errors, or replies without any reason) are not journaled,
+                    # so the next run retries them
+                    good = [(df.at[idx, "filename"], updates) for idx, updates in zip(batch, results) if has_reasons(updates)]
+                    if len(good) < len(batch):
+                        empty = [idx for idx, updates in zip(batch, results) if not has_reasons(updates)]
+                        failed += len(empty)
+                        print(f"Failed rows {empty}: reply had no reasons")
+                    if good:
+                        journal.append(good)
+                before = processed
+                processed += len(batch)
+                if processed // 10 > before // 10:
+                    rate = processed / (time.perf_counter() - start)
+                    print(f"Progress: {processed}/{len(pending)} rows ({rate:.1f} rows/sec)")
+                submit_next()
+    journal.close()
 
+    elapsed = time.perf_counter() - start
+    print(f"Completed processing {processed} rows in {elapsed:.1f}s "
+          f"({processed / elapsed if elapsed > 0 else 0:.1f} rows/sec), {failed} failed.")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%})")
+    filled = compact_journal(input_csv_path, journal.path, output_csv_path)
+    print(f"Compacted journal into {output_csv_path} ({filled} enriched rows)")
 
-if __name__ == "__main__":
-    # 修复后的提示词模板 - 使用三引号避免转义问题
-    PROMPT_TEMPLATE = '''
-Comment: {comment}
 
-Please extract short sentences and phrases from the comments that reflect the reasons for the score of a specific aesthetic attribute.
+def main():
+    parser = argparse.ArgumentParser(description="Extract per-dimension reasons from APDD comments with an LLM")
+    parser.add_argument("--input", default="APDD.csv")
+    parser.add_argument("--output", default="APDD_enriched.csv")
+    parser.add_argument("--batch-size", type=int, default=1, help="comments packed into one prompt")
+    parser.add_argument("--concurrency", type=int, default=8, help="maximum requests in flight")
+    parser.add_argument("--rps", type=float, default=2.0, help="request rate limit (requests/sec)")
+    parser.add_argument("--max-retries", type=int, default=6)
+    parser.add_argument("--base-url", default=BASE_URL, help="OpenAI-compatible endpoint, e.g. a local fake server")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--journal", default=None, help="results journal (default: <output>.journal.jsonl)")
+    parser.add_argument("--compact-only", action="store_true", help="only merge the journal into the output CSV")
+    parser.add_argument("--cache-dir", default=None, help="LLM response cache directory (default: LLM_CACHE_DIR)")
+    parser.add_argument("--no-cache", action="store_true", help="always call the model")
+    args = parser.parse_args()
 
-Return the result in the following JSON format:
-{{
-    "reason_for_theme_and_logic": "",
-    "reason_for_creativity": "",
-    "reason_for_layout_and_composition": "",
-    "reason_for_space_and_perspective": "",
-    "reason_for_sense_of_order": "",
-    "reason_for_light_and_shadow": "",
-    "reason_for_color": "",
-    "reason_for_details_and_texture": "",
-    "reason_for_overall": "",
-    "reason_for_mood": ""
-}}
-
-Note: 
-- If no reasons for a certain dimension can be found in the comment, fill in an empty string
-- Do not fabricate information
-- Only use phrases directly from the comment
-
-Here are 10 aesthetic attributes and their interpretations:
-- Theme and Logic: The central idea aligns with the artistic expression, ensuring consistency and appropriateness in composition, layout, and color.
-- Creativity: Innovative qualities that break conventions, including satire, self-deprecation, and allegorical warnings.
-- Layout and Composition: The visual structure and organization of an image, reflecting the underlying logic and essence of its form.
-- Space and Perspective: Layered spatial arrangements and perspective techniques create three-dimensionality and spatial effects.
-- Sense of Order: Visual unity and consistency in morphological, spatial, orientational, and dynamic elements.
-- Light and Shadow: Enhance visual rhythm and realism, decorate space, suggest themes, and segment the image.
-- Color: Evokes emotional atmospheres with a harmonious palette, using contrasts in temperature, brightness, and purity.
-- Details and Texture: Vivid details and delicate textures enhance realism, imbuing life into the image.
-- The Overall: Emphasizes coherence and a clear theme, combining form and spirit in the presentation.
-- Mood: Creates a poetic space blending scenes, reality, and illusion, emphasizing tranquility, emptiness, and spirituality.
-
-example:
-the comment is "Each side of the picture is good, making it a great landscape painting. The brushstrokes are skilled, and the visual effect is realistic"
-the answer should be:
-{{
-    "reason_for_theme_and_logic": "",
-    "reason_for_creativity": "",
-    "reason_for_layout_and_composition": "Each side of the picture is good",
-    "reason_for_space_and_perspective": "",
-    "reason_for_sense_of_order": "",
-    "reason_for_light_and_shadow": "",
-    "reason_for_color": "",
-    "reason_for_details_and_texture": "The brushstrokes are skilled",
-    "reason_for_overall": "making it a great landscape painting",
-    "reason_for_mood": ""
-}}
-'''.strip()
-
-    input_path = "APDD.csv"
-    output_path = "APDD_enriched.csv"
+    if args.compact_only:
+        journal_path = args.journal or default_journal_path(args.output)
+        filled = compact_journal(args.input, journal_path, args.output)
+        print(f"Compacted {journal_path} into {args.output} ({filled} enriched rows)")
+        return
 
     enrich_csv(
-        input_csv_path=input_path,
-        output_csv_path=output_path,
+        input_csv_path=args.input,
+        output_csv_path=args.output,
         prompt_template=PROMPT_TEMPLATE,
-        batch_size=1,
-        rate_limit_sleep_s=0.5,  # 添加0.5秒延迟避免速率限制
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        requests_per_second=args.rps,
+        max_retries=args.max_retries,
+        client=create_client(args.base_url),
+        model=args.model,
+        journal_path=args.journal,
+        cache=None if args.no_cache else LLMCache(args.cache_dir) if args.cache_dir else LLMCache(),
     )
-    print(f"Enriched CSV written to: {output_path}")
\ No newline at end of file
+    print(f"Enriched CSV written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
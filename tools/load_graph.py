@@ -0,0 +1,312 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedstore import EmbeddingStore
+
+# Source CSVs (see csv/) and how each one maps onto the graph
+NODE_FILES = [
+    ("Category.csv", "Category"),
+    ("Artstyle.csv", "Artstyle"),
+    ("Subject.csv", "Subject"),
+    ("AestheticDimension.csv", "Dimension"),
+]
+REL_FILES = [
+    ("Artwork_Category.csv", "category", "Category", "BELONGS_TO_CATEGORY"),
+    ("Artwork_STYLE.csv", "style", "Artstyle", "BELONGS_TO_STYLE"),
+    ("Artwork_Subject.csv", "subject", "Subject", "BELONGS_TO_SUBJECT"),
+]
+LEVEL_FILE = "Artwork_DIMENSION.csv"
+
+# Neo4jVector's default index name, so Neo4jRetriever / Neo4jVector pick it up as-is
+VECTOR_INDEX = "vector"
+EMBEDDING_DIM = 512
+
+CONSTRAINTS = [
+    "CREATE CONSTRAINT artwork_id IF NOT EXISTS FOR (n:Artwork) REQUIRE n.id IS UNIQUE",
+    "CREATE CONSTRAINT artwork_filename IF NOT EXISTS FOR (n:Artwork) REQUIRE n.filename IS UNIQUE",
+] + [
+    f"CREATE CONSTRAINT {label.lower()}_id IF NOT EXISTS FOR (n:{label}) REQUIRE n.id IS UNIQUE"
+    for _, label in NODE_FILES
+]
+
+
+def vector_index_statement(dim=EMBEDDING_DIM, name=VECTOR_INDEX):
+    return (
+        f"CREATE VECTOR INDEX {name} IF NOT EXISTS FOR (n:Artwork) ON (n.embedding) "
+        f"OPTIONS {{indexConfig: {{`vector.dimensions`: {int(dim)}, `vector.similarity_function`: 'cosine'}}}}"
+    )
+
+
+# Bulk mode assumes an empty database and uses CREATE; upsert mode MERGEs on ids
+# so it can be re-run and used to add new artworks to an existing graph.
+ARTWORK_QUERIES = {
+    "bulk": """
+UNWIND $rows AS row
+CREATE (a:Artwork {id: row.id, filename: row.filename})
+WITH a, row WHERE row.embedding IS NOT NULL
+SET a.embedding = row.embedding
+""",
+    "upsert": """
+UNWIND $rows AS row
+MERGE (a:Artwork {id: row.id})
+SET a.filename = row.filename
+WITH a, row WHERE row.embedding IS NOT NULL
+SET a.embedding = row.embedding
+""",
+}
+NODE_QUERIES = {
+    "bulk": "UNWIND $rows AS row CREATE (:{label} {{id: row.id}})",
+    "upsert": "UNWIND $rows AS row MERGE (:{label} {{id: row.id}})",
+}
+REL_QUERIES = {
+    "bulk": """
+UNWIND $rows AS row
+MATCH (a:Artwork {{id: row.artwork}})
+MATCH (b:{label} {{id: row.target}})
+CREATE (a)-[:{rel}]->(b)
+""",
+    "upsert": """
+UNWIND $rows AS row
+MATCH (a:Artwork {{id: row.artwork}})
+MATCH (b:{label} {{id: row.target}})
+MERGE (a)-[:{rel}]->(b)
+""",
+}
+# One HAS_LEVEL per (artwork, dimension): MERGE on the pair and SET the properties,
+# so a changed level/reason updates the edge instead of adding a second one
+LEVEL_QUERIES = {
+    "bulk": """
+UNWIND $rows AS row
+MATCH (a:Artwork {id: row.artwork})
+MATCH (d:Dimension {id: row.dimension})
+CREATE (a)-[:HAS_LEVEL {level: row.level, reason: row.reason}]->(d)
+""",
+    "upsert": """
+UNWIND $rows AS row
+MATCH (a:Artwork {id: row.artwork})
+MATCH (d:Dimension {id: row.dimension})
+MERGE (a)-[r:HAS_LEVEL]->(d)
+SET r.level = row.level, r.reason = row.reason
+""",
+}
+EXISTING_ARTWORKS_QUERY = "MATCH (a:Artwork) RETURN a.id AS id"
+
+
+class DriverGraph:
+    """Minimal `query(cypher, params)` wrapper over a pooled neo4j driver."""
+
+    def __init__(self, url, username, password, database=None):
+        from neo4j import GraphDatabase
+
+        self.driver = GraphDatabase.driver(url, auth=(username, password))
+        self.driver.verify_connectivity()
+        self.database = database
+
+    def query(self, query, params=None):
+        records, _, _ = self.driver.execute_query(query, params or {}, database_=self.database)
+        return [r.data() for r in records]
+
+    def close(self):
+        self.driver.close()
+
+
+class DryRunGraph:
+    """
+    Local stand-in that accepts every statement without a database.
+
+    Records each statement with its batch size, so the loader's batching, row
+    counts and client-side throughput can be checked offline.
+    """
+
+    def __init__(self, existing_ids=()):
+        self.existing_ids = list(existing_ids)
+        self.statements = []
+
+    def query(self, query, params=None):
+        rows = (params or {}).get("rows")
+        self.statements.append((query.strip(), len(rows) if rows is not None else None))
+        if query.strip() == EXISTING_ARTWORKS_QUERY:
+            return [{"id": i} for i in self.existing_ids]
+        return []
+
+    def close(self):
+        pass
+
+
+def read_rows(path: str) -> Iterator[Dict[str, str]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def batched(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class GraphLoader:
+    """
+    Push the graph CSVs into Neo4j as batched `UNWIND $rows` transactions.
+
+    `graph` is anything with `query(cypher, params)`: DriverGraph, Neo4jGraph or DryRunGraph.
+    mode="bulk" CREATEs into an empty database; mode="upsert" MERGEs, and with
+    only_new=True skips artworks (and their edges) already in the graph.
+    """
+
+    def __init__(self, graph, csv_dir="csv", mode="upsert", batch_size=5000, embedding_batch_size=500,
+                 store: Optional[EmbeddingStore] = None, only_new=False):
+        if mode not in ARTWORK_QUERIES:
+            raise ValueError(f"mode must be one of {list(ARTWORK_QUERIES)}")
+        self.graph = graph
+        self.csv_dir = csv_dir
+        self.mode = mode
+        self.batch_size = batch_size
+        self.embedding_batch_size = embedding_batch_size
+        self.store = store
+        self.only_new = only_new
+        self.skip_ids = set()
+        self.report = []
+
+    def _run(self, name, query, rows, batch_size=None):
+        """Send rows in batches and record rows/sec for this step."""
+        start = time.perf_counter()
+        count = batches = 0
+        for batch in batched(rows, batch_size or self.batch_size):
+            self.graph.query(query, {"rows": batch})
+            count += len(batch)
+            batches += 1
+        seconds = time.perf_counter() - start
+        rate = count / seconds if seconds > 0 else 0.0
+        self.report.append({"step": name, "rows": count, "batches": batches, "seconds": seconds, "rows_per_sec": rate})
+        print(f"{name}: {count} rows in {batches} batches, {seconds:.2f}s ({rate:,.0f} rows/sec)")
+        return count
+
+    def create_schema(self, dim=EMBEDDING_DIM):
+        for statement in CONSTRAINTS + [vector_index_statement(dim)]:
+            self.graph.query(statement)
+        print(f"Constraints and vector index '{VECTOR_INDEX}' ({dim}-d, cosine) are in place")
+
+    def _embedding(self, row):
+        if self.store is not None:
+            vector = self.store.get(row["filename"])
+            return vector.tolist() if vector is not None else None
+        # Fall back to a JSON list in the CSV's embedding column (convert_embedding.py --format csv)
+        value = row.get("embedding")
+        return json.loads(value) if value else None
+
+    def _new(self, rows, key):
+        return (r for r in rows if r[key] not in self.skip_ids)
+
+    def load_artworks(self):
+        if self.only_new:
+            self.skip_ids = {r["id"] for r in self.graph.query(EXISTING_ARTWORKS_QUERY)}
+            print(f"{len(self.skip_ids)} artworks already in the graph will be skipped")
+        rows = (
+            {"id": r["id"], "filename": r["filename"].strip(), "embedding": self._embedding(r)}
+            for r in self._new(read_rows(os.path.join(self.csv_dir, "Artwork.csv")), "id")
+        )
+        return self._run("Artwork", ARTWORK_QUERIES[self.mode], rows, self.embedding_batch_size)
+
+    def load_nodes(self):
+        for filename, label in NODE_FILES:
+            rows = ({"id": r["id"]} for r in read_rows(os.path.join(self.csv_dir, filename)))
+            self._run(label, NODE_QUERIES[self.mode].format(label=label), rows)
+
+    def load_relationships(self):
+        for filename, column, label, rel in REL_FILES:
+            rows = (
+                {"artwork": r["artwork"], "target": r[column]}
+                for r in self._new(read_rows(os.path.join(self.csv_dir, filename)), "artwork")
+                if r[column]
+            )
+            self._run(rel, REL_QUERIES[self.mode].format(label=label, rel=rel), rows)
+        rows = (
+            {"artwork": r["artwork"], "dimension": r["dimension"], "level": r["level"], "reason": r["reason"] or ""}
+            for r in self._new(read_rows(os.path.join(self.csv_dir, LEVEL_FILE)), "artwork")
+        )
+        self._run("HAS_LEVEL", LEVEL_QUERIES[self.mode], rows)
+
+    def load_all(self, create_schema=True):
+        start = time.perf_counter()
+        if create_schema:
+            dim = self.store.dim if self.store is not None else EMBEDDING_DIM
+            self.create_schema(dim)
+        self.load_nodes()
+        self.load_artworks()
+        self.load_relationships()
+        total = sum(step["rows"] for step in self.report)
+        seconds = time.perf_counter() - start
+        print(f"Total: {total} rows in {seconds:.2f}s ({total / seconds if seconds > 0 else 0:,.0f} rows/sec)")
+        return self.report
+
+
+def reload_server(base_url, timeout=10):
+    """Ask a running server.py to drop its cached schema and QA chains so the new data is queryable."""
+    request = urllib.request.Request(
+        base_url.rstrip("/") + "/v1/admin/reload", data=b"{}",
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            resp.read()
+    except (urllib.error.URLError, OSError) as e:
+        print(f"Could not reload {base_url}: {e}; it picks up the new schema within SCHEMA_CACHE_TTL")
+        return False
+    print(f"Reloaded graph caches on {base_url}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the graph CSVs and embeddings into Neo4j with batched UNWIND")
+    parser.add_argument("--csv-dir", default="csv")
+    parser.add_argument("--embeddings", default="embeddings",
+                        help="embedding store directory (embedstore.py); falls back to Artwork.csv's embedding column")
+    parser.add_argument("--mode", choices=["bulk", "upsert"], default="upsert",
+                        help="bulk: CREATE into an empty database; upsert: MERGE, safe to re-run")
+    parser.add_argument("--only-new", action="store_true", help="upsert only artworks not already in the graph")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per transaction")
+    parser.add_argument("--embedding-batch-size", type=int, default=500, help="artwork rows per transaction")
+    parser.add_argument("--no-schema", action="store_true", help="skip creating constraints and the vector index")
+    parser.add_argument("--url", default=os.getenv("NEO4J_URI", "neo4j://localhost:7687"))
+    parser.add_argument("--username", default=os.getenv("NEO4J_USERNAME", "neo4j"))
+    parser.add_argument("--password", default=os.getenv("NEO4J_PASSWORD", ""))
+    parser.add_argument("--database", default=os.getenv("NEO4J_DATABASE"))
+    parser.add_argument("--dry-run", action="store_true", help="run against a local stand-in instead of Neo4j")
+    parser.add_argument("--reload-server", metavar="URL", default=os.getenv("GALLERY_API_URL"),
+                        help="server.py to tell to drop its cached schema after loading (default: $GALLERY_API_URL)")
+    args = parser.parse_args()
+
+    if args.only_new and args.mode != "upsert":
+        parser.error("--only-new requires --mode upsert")
+
+    store = EmbeddingStore(args.embeddings) if os.path.isdir(args.embeddings) else None
+    if store is None:
+        print(f"Embedding store {args.embeddings} not found, using Artwork.csv's embedding column")
+    graph = DryRunGraph() if args.dry_run else DriverGraph(args.url, args.username, args.password, args.database)
+    try:
+        loader = GraphLoader(
+            graph, csv_dir=args.csv_dir, mode=args.mode, batch_size=args.batch_size,
+            embedding_batch_size=args.embedding_batch_size, store=store, only_new=args.only_new,
+        )
+        loader.load_all(create_schema=not args.no_schema)
+    finally:
+        graph.close()
+    if args.reload_server and not args.dry_run:
+        reload_server(args.reload_server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 请求级追踪与指标：
+# - span(name, **attrs) 记录一个阶段的耗时、属性和异常，归属到当前请求的关联ID（request_id）
+# - 每个span结束时输出一行JSON结构化日志（TRACE_LOG=- 输出到stderr，或指定文件路径），
+#   并计入 gallery_span_duration_seconds / gallery_span_errors_total 指标
+# - inc / observe 记录计数器和直方图（缓存命中、负载字节数、token数等）
+# - start_metrics_server(port) 以Prometheus文本格式在 /metrics 暴露所有指标（METRICS_PORT）
+
+TRACE_LOG = os.getenv("TRACE_LOG", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# 耗时直方图的默认分桶（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 字节数直方图的分桶
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2e7)
+# token数直方图的分桶
+TOKEN_BUCKETS = (10, 50, 100, 200, 400, 800, 1600, 3200, 6400)
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+logger = logging.getLogger("gallery.trace")
+logger.propagate = False
+if TRACE_LOG:
+    _handler = logging.StreamHandler() if TRACE_LOG == "-" else logging.FileHandler(TRACE_LOG, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+@contextmanager
+def trace_request(request_id=None):
+    """为一次请求设置关联ID，期间产生的span都带上该ID；返回ID"""
+    request_id = request_id or uuid.uuid4().hex[:12]
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
+
+
+def log_event(event, **fields):
+    """输出一行JSON结构化日志（未配置TRACE_LOG时不输出）"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    record = {"ts": round(time.time(), 3), "event": event, "request_id": current_request_id()}
+    record.update(fields)
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class Span:
+    """一个被追踪的阶段，用作上下文管理器；set(**attrs)补充属性（如缓存是否命中、结果条数）"""
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.request_id = current_request_id()
+        self.duration = None
+        self.error = None
+        self._message = None
+        self._start = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def elapsed(self):
+        """span开始至今的秒数"""
+        return time.perf_counter() - self._start
+
+    def record_error(self, exc):
+        """记录被调用方捕获、没有向外抛出的异常"""
+        self.error = type(exc).__name__
+        self._message = str(exc)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        if exc_type is GeneratorExit:
+            # 流式生成器被提前关闭（如用户中断），记为取消，不计入错误
+            self.attrs["cancelled"] = True
+        elif exc_type is not None:
+            self.record_error(exc)
+        observe("gallery_span_duration_seconds", self.duration, span=self.name)
+        fields = {"request_id": self.request_id, "span": self.name, "duration_ms": round(self.duration * 1000, 2)}
+        if self.error is not None:
+            inc("gallery_span_errors_total", span=self.name, error=self.error)
+            fields["error"] = f"{self.error}: {self._message}"
+        fields.update(self.attrs)
+        log_event("span", **fields)
+        return False
+
+
+def span(name, **attrs):
+    return Span(name, **attrs)
+
+
+def record_cache(cache, hit):
+    """记录一次缓存查询"""
+    inc("gallery_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+# -----------------------------------------------------------------------------
+# 指标：计数器和直方图，按 (指标名, 标签) 聚合
+# -----------------------------------------------------------------------------
+_counters = {}    # name -> {labels: value}
+_histograms = {}  # name -> (buckets, {labels: [bucket_counts, sum, count]})
+_metrics_lock = threading.Lock()
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    with _metrics_lock:
+        series = _counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+
+def observe(name, value, buckets=None, **labels):
+    """向直方图name中记录一个值；buckets只在指标第一次出现时生效"""
+    with _metrics_lock:
+        if name not in _histograms:
+            _histograms[name] = (tuple(buckets or DURATION_BUCKETS), {})
+        bounds, series = _histograms[name]
+        state = series.setdefault(_labels(labels), [[0] * len(bounds), 0.0, 0])
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                state[0][i] += 1
+        state[1] += value
+        state[2] += 1
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def render_metrics():
+    """Prometheus文本格式的全部指标"""
+    lines = []
+    with _metrics_lock:
+        for name, series in sorted(_counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, (bounds, series) in sorted(_histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, (counts, total, count) in series.items():
+                for bound, c in zip(bounds, counts):
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {c}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """在后台守护线程中启动 /metrics 服务，返回server（port=0时由系统分配端口）"""
+    port = METRICS_PORT if port is None else port
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    print(f"指标服务已启动: http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,167 @@
+import os
+import threading
+
+import numpy as np
+
+from embedstore import EmbeddingStore
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norm = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norm, 1e-12)
+
+
+def _topk(scores, k):
+    """对每一行取分数最高的k个下标（按分数降序）"""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=-1), axis=-1)
+    return np.take_along_axis(idx, order, axis=-1)
+
+
+class ExactIndex:
+    """精确检索：归一化矩阵与查询向量做一次矩阵乘法（余弦相似度）"""
+
+    def __init__(self, store):
+        rows = np.flatnonzero(np.asarray(store.valid))
+        self.filenames = [store.filenames[i] for i in rows]
+        self.matrix = _normalize(store.matrix[rows])
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def search_batch(self, queries, k=2):
+        """批量查询，返回每个查询的文件名列表"""
+        scores = _normalize(np.atleast_2d(queries)) @ self.matrix.T
+        return [[self.filenames[i] for i in row] for row in _topk(scores, k)]
+
+    def search(self, query, k=2):
+        return self.search_batch(query, k)[0]
+
+
+class IVFIndex:
+    """
+    近似检索（IVF）：用球面k-means把向量划分到nlist个簇，查询时只扫描最近的nprobe个簇。
+    有效向量比簇数还少时（包括没有有效向量）不做划分，退化为ExactIndex
+    """
+
+    def __init__(self, store, nlist=None, nprobe=8, n_iter=10, seed=0, centroids=None):
+        rows = np.flatnonzero(np.asarray(store.valid))
+        self.filenames = [store.filenames[i] for i in rows]
+        self.matrix = _normalize(store.matrix[rows])
+        self.nprobe = nprobe
+        if centroids is None:
+            nlist = nlist or max(1, int(np.sqrt(len(self.matrix))))
+        else:
+            nlist = len(centroids)
+        self.exact = ExactIndex(store) if len(self.matrix) < nlist else None
+        if self.exact is not None:
+            self.centroids = None
+            return
+        if centroids is None:
+            centroids = self._kmeans(self.matrix, nlist, n_iter, seed)
+        self.centroids = _normalize(centroids)
+        assign = np.argmax(self.matrix @ self.centroids.T, axis=1)
+        # 倒排表：按簇排序后的行号，以及每个簇在其中的起止位置
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(len(self.centroids) + 1))
+
+    @staticmethod
+    def _kmeans(x, nlist, n_iter, seed):
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist, len(x))
+        centroids = x[rng.choice(len(x), size=nlist, replace=False)]
+        for _ in range(n_iter):
+            assign = np.argmax(x @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, x)
+            counts = np.bincount(assign, minlength=nlist)
+            # 空簇保留原中心
+            empty = counts == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+        return centroids
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def search_batch(self, queries, k=2):
+        if self.exact is not None:
+            return self.exact.search_batch(queries, k)
+        queries = _normalize(np.atleast_2d(queries))
+        probes = _topk(queries @ self.centroids.T, self.nprobe)
+        results = []
+        for q, lists in zip(queries, probes):
+            candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+            scores = self.matrix[candidates] @ q
+            results.append([self.filenames[candidates[i]] for i in _topk(scores, k)])
+        return results
+
+    def search(self, query, k=2):
+        return self.search_batch(query, k)[0]
+
+    def save(self, path):
+        np.save(path, self.centroids)
+
+    @classmethod
+    def load(cls, store, path, nprobe=8):
+        return cls(store, nprobe=nprobe, centroids=np.load(path))
+
+
+INDEX_TYPES = {"exact": ExactIndex, "ivf": IVFIndex}
+
+# 进程内缓存已构建的索引，避免每次请求重复加载
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(store_path, kind="exact"):
+    """按向量存储路径和索引类型返回（并缓存）检索索引"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"未知的检索后端: {kind}，可选 {list(INDEX_TYPES)}")
+    key = (os.path.abspath(store_path), kind)
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            store = EmbeddingStore(store_path)
+            ivf_path = os.path.join(store_path, "ivf_centroids.npy")
+            if kind == "ivf" and os.path.exists(ivf_path):
+                index = IVFIndex.load(store, ivf_path)
+            else:
+                index = INDEX_TYPES[kind](store)
+            _indexes[key] = index
+        return index
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="预构建IVF索引并评估召回率")
+    parser.add_argument("store", nargs="?", default="embeddings")
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.store)
+    exact = ExactIndex(store)
+    start = time.perf_counter()
+    ivf = IVFIndex(store, nlist=args.nlist, nprobe=args.nprobe)
+    if ivf.exact is not None:
+        parser.exit(message=f"有效向量（{len(ivf)}个）少于簇数，IVF退化为精确检索，未保存索引\n")
+    print(f"IVF构建完成: {len(ivf.centroids)} 个簇，用时 {time.perf_counter() - start:.2f}s")
+    ivf.save(os.path.join(args.store, "ivf_centroids.npy"))
+
+    queries = exact.matrix[:min(200, len(exact))]
+    start = time.perf_counter()
+    truth = exact.search_batch(queries, args.k)
+    t_exact = time.perf_counter() - start
+    start = time.perf_counter()
+    approx = ivf.search_batch(queries, args.k)
+    t_ivf = time.perf_counter() - start
+    recall = np.mean([len(set(a) & set(t)) / len(t) for a, t in zip(approx, truth)])
+    print(f"exact: {t_exact / len(queries) * 1e3:.3f} ms/query, ivf: {t_ivf / len(queries) * 1e3:.3f} ms/query, recall@{args.k}: {recall:.3f}")
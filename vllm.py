@@ -1,46 +1,222 @@
-from langchain_openai import ChatOpenAI
-from openai import OpenAI
 from PIL import Image
 import base64
+import math
 import os
 import io
+from thumbpack import get_thumbpack
+from tracing import BYTES_BUCKETS, TOKEN_BUCKETS, inc, observe, record_cache, span
+
+# 参考图片的预生成缩略图打包文件（见thumbpack.py），不存在时回退到实时编码
+THUMBPACK_PATH = os.getenv("THUMBPACK_PATH", "thumbs.pack")
+
+# 单次请求的负载上限（字节），超出时丢弃可选的参考图片
+MAX_PAYLOAD_BYTES = int(float(os.getenv("VLLM_MAX_PAYLOAD_MB", "20")) * 2**20)
+MAX_PAYLOAD_TOKENS = int(os.getenv("VLLM_MAX_PAYLOAD_TOKENS", "0")) or None
+
+# 单张图片的token估算（高清模式下1024x1024图片约为765 token）
+IMAGE_TOKENS = 765
+
+# 单次请求中所有图片的token预算
+IMAGE_TOKEN_BUDGET = int(os.getenv("VLLM_IMAGE_TOKEN_BUDGET", "1500"))
+
+# 每种角色的候选编码(detail, 最长边)，从高质量到低成本排列，预算不足时逐级降级
+ENCODING_LADDERS = {
+    "target": [("high", 2048), ("high", 1024), ("high", 512), ("low", 512)],
+    "reference": [("high", 768), ("high", 512), ("low", 512)],
+}
+# 每种角色的编码格式和质量；参考图片只提供上下文，用更省字节的WebP
+ROLE_CODECS = {
+    "target": ("JPEG", 85),
+    "reference": ("WEBP", 75),
+}
+
+class MessageBuilder:
+    """
+    单次请求的多模态消息构造器：只持有本次请求的图片和文本，
+    按字节数/估算token数限制负载，可选内容（参考图片）超出预算时被丢弃，必需内容超出时报错
+    """
+
+    def __init__(self, max_bytes=MAX_PAYLOAD_BYTES, max_tokens=MAX_PAYLOAD_TOKENS,
+                 reserve_bytes=64 * 1024, reserve_tokens=2000):
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        # 为之后加入的必需内容（如prompt文本）预留的空间，只对可选内容生效
+        self.reserve_bytes = reserve_bytes
+        self.reserve_tokens = reserve_tokens
+        self.parts = []
+        self.payload_bytes = 0
+        self.estimated_tokens = 0
+        self.dropped = []
+
+    def _fits(self, size, tokens):
+        if self.max_bytes is not None and self.payload_bytes + size > self.max_bytes:
+            return False
+        if self.max_tokens is not None and self.estimated_tokens + tokens > self.max_tokens:
+            return False
+        return True
+
+    def _add(self, part, size, tokens, required, label):
+        if required:
+            fits = self._fits(size, tokens)
+        else:
+            fits = self._fits(size + self.reserve_bytes, tokens + self.reserve_tokens)
+        if not fits:
+            if required:
+                raise ValueError(f"请求负载超出预算: {label}（{size} bytes, ~{tokens} tokens）")
+            self.dropped.append(label)
+            return False
+        self.parts.append(part)
+        self.payload_bytes += size
+        self.estimated_tokens += tokens
+        return True
+
+    def add_image(self, part, required=True, tokens=IMAGE_TOKENS, label="image"):
+        """添加encode_image返回的image_url内容，返回是否已加入"""
+        size = len(part["image_url"]["url"])
+        return self._add(part, size, tokens, required, label)
+
+    def add_text(self, text, required=True, label="text"):
+        size = len(text.encode("utf-8"))
+        # 粗略估算：约4个字符一个token
+        return self._add({"type": "text", "text": text}, size, (len(text) + 3) // 4, required, label)
+
+    def build(self):
+        return [{"role": "user", "content": list(self.parts)}]
+
+def effective_size(width, height, detail="high", max_side=2048):
+    """模型实际看到的分辨率：先缩放到max_side以内；高清模式下再缩放到2048以内且短边不超过768，低清模式为512以内"""
+    limit = min(max_side, 2048 if detail == "high" else 512)
+    scale = min(1.0, limit / max(width, height))
+    if detail == "high":
+        scale = min(scale, 768 / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def estimate_image_tokens(width, height, detail="high"):
+    """按视觉模型的计费规则估算图片token：低清固定85，高清为85+170*512切片数"""
+    if detail == "low":
+        return 85
+    w, h = effective_size(width, height, "high")
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+def plan_image_encodings(images, budget=IMAGE_TOKEN_BUDGET):
+    """
+    为每张图片选择编码方案，使估算token总和不超过预算：先降级参考图片（从最贵的开始），再降级目标图片
+
+    参数：
+        images: [(role, (width, height))]，role为"target"或"reference"
+        budget: token预算
+    返回：
+        与images对应的方案列表，每项包含role、detail、size、format、quality、tokens
+    """
+    levels = [0] * len(images)
+
+    def plan(i):
+        role, (width, height) = images[i]
+        detail, max_side = ENCODING_LADDERS[role][levels[i]]
+        size = effective_size(width, height, detail, max_side)
+        img_format, quality = ROLE_CODECS[role]
+        return {
+            "role": role,
+            "detail": detail,
+            "size": size,
+            "format": img_format,
+            "quality": quality,
+            "tokens": estimate_image_tokens(size[0], size[1], detail),
+        }
+
+    plans = [plan(i) for i in range(len(images))]
+    while sum(p["tokens"] for p in plans) > budget:
+        candidates = [i for i, (role, _) in enumerate(images) if levels[i] + 1 < len(ENCODING_LADDERS[role])]
+        if not candidates:
+            break
+        references = [i for i in candidates if images[i][0] == "reference"]
+        i = max(references or candidates, key=lambda j: plans[j]["tokens"])
+        levels[i] += 1
+        plans[i] = plan(i)
+    return plans
+
+def encode_image(image, plan):
+    """按plan_image_encodings给出的方案缩放并编码图片（路径或文件对象），返回消息内容"""
+    img = Image.open(image)
+    if img.size != plan["size"]:
+        img = img.resize(plan["size"], Image.Resampling.LANCZOS)
+    if img.mode in ("RGBA", "LA", "P"):
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", img.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
 
-user_content = []
-# 图片转base64并存入消息内容
-def optimize_image_for_api(image_path, max_size=(2048, 2048), quality=85):
-    """优化图片以减少token消耗"""
-    img = Image.open(image_path)
-    
-    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-    
-    if img.mode in ('RGBA', 'LA', 'P'):
-        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-        rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-        img = rgb_img
-    
     buffer = io.BytesIO()
-    img_format = image_path.split('.')[-1].upper()
-    if img_format == 'JPG':
-        img_format = 'JPEG' 
-    img.save(buffer, format=img_format, quality=quality, optimize=True)
-    buffer.seek(0)
-
-    base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    user_content.append({
+    img.save(buffer, format=plan["format"], quality=plan["quality"])
+    base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
+    return {
         "type": "image_url",
         "image_url": {
-            "url": f"data:image/{img_format};base64,{base64_image}" 
-        }
-    })
+            "url": f"data:image/{plan['format'].lower()};base64,{base64_image}",
+            "detail": plan["detail"],
+        },
+    }
+
+# 编码目标图片。参考图片总是先于目标图片被降级，所以目标图片的方案只取决于参考图片的数量，
+# 可以在相似检索完成之前就开始编码
+def encode_target_image(target_image_path,num_references=1):
+    with span("encode_target") as sp:
+        with Image.open(target_image_path) as img:
+            size = img.size
+        plan = plan_image_encodings([("target", size)] + [("reference", (512, 512))] * num_references)[0]
+        part = encode_image(target_image_path, plan)
+        sp.set(detail=plan["detail"], bytes=len(part["image_url"]["url"]))
+    return part, plan
+
+# 在目标图片已占用的token之外，为参考图片选择编码方案并编码，返回[(filename, part, plan)]
+def encode_reference_images(image_filenames,target_plan=None):
+    pack = get_thumbpack(THUMBPACK_PATH)
+
+    def source_size(filename):
+        if pack is not None and filename in pack:
+            return pack.size(filename)
+        with Image.open(os.path.join("images", filename)) as img:
+            return img.size
+
+    with span("encode_refs", images=len(image_filenames)) as sp:
+        budget = IMAGE_TOKEN_BUDGET - (target_plan["tokens"] if target_plan else 0)
+        plans = plan_image_encodings([("reference", source_size(f)) for f in image_filenames], budget)
+        references = []
+        for filename, plan in zip(image_filenames, plans):
+            data_url = pack.get(filename) if pack is not None else None
+            if pack is not None:
+                record_cache("thumbpack", data_url is not None)
+            if data_url is None:
+                part = encode_image(os.path.join("images", filename), plan)
+            elif tuple(pack.size(filename)) == tuple(plan["size"]) and pack.format == plan["format"]:
+                # 预生成的缩略图与方案一致（未被降级），直接发送，只设置detail
+                part = {"type": "image_url", "image_url": {"url": data_url, "detail": plan["detail"]}}
+            else:
+                # 方案更小或格式不同：从缩略图重新编码，保证实际发送的图片与估算的token一致
+                encoded = base64.b64decode(data_url.split(",", 1)[1])
+                part = encode_image(io.BytesIO(encoded), plan)
+            references.append((filename, part, plan))
+        sp.set(bytes=sum(len(part["image_url"]["url"]) for _, part, _ in references))
+    return references
+
+# 构造本次请求的多模态消息（目标图片+参考图片+prompt）
+# target/references可传入提前编码好的结果（encode_target_image / encode_reference_images）
+def build_vllm_messages(kg,user_instruction,target_image_path,image_filenames,target=None,references=None):
+    builder = MessageBuilder()
+    if target is None:
+        target = encode_target_image(target_image_path, len(image_filenames))
+    if references is None:
+        references = encode_reference_images(image_filenames, target[1])
 
-def call_vllm(client,GPT_MODEL,kg,user_instruction,target_image_path,image_filenames):
     # 将图片转换为base64
-    optimize_image_for_api(target_image_path)
+    target_part, target_plan = target
+    builder.add_image(target_part, tokens=target_plan["tokens"], label=target_image_path)
     note_name="Sequence of uploaded images: the filename of the No.1 image is "+target_image_path
-    for idx, filename in enumerate(image_filenames):
-        note_name+=", the filename of the No."+str(idx+2)+" image is "+filename
-        image_path = os.path.join("images", filename)
-        optimize_image_for_api(image_path)
+    for filename, part, plan in references:
+        # 参考图片是可选的，超出预算时跳过，图片序号只计入实际发送的图片
+        if builder.add_image(part, required=False, tokens=plan["tokens"], label=filename):
+            note_name+=", the filename of the No."+str(len(builder.parts))+" image is "+filename
 
     # 构造prompt
     prompt = f"""
@@ -71,22 +247,67 @@ def call_vllm(client,GPT_MODEL,kg,user_instruction,target_image_path,image_filen
     """
     # print(prompt)
 
-    user_content.append({
-            "type": "text",
-            "text": prompt
-        })
+    builder.add_text(prompt)
+    image_tokens = target_plan["tokens"] + sum(plan["tokens"] for _, _, plan in references)
+    print(f"请求负载: {builder.payload_bytes} bytes, ~{builder.estimated_tokens} tokens（图片约 {image_tokens}），丢弃: {builder.dropped}")
+    observe("gallery_vllm_payload_bytes", builder.payload_bytes, buckets=BYTES_BUCKETS)
+    observe("gallery_vllm_input_tokens", builder.estimated_tokens, buckets=TOKEN_BUCKETS)
+    if builder.dropped:
+        inc("gallery_vllm_dropped_images_total", len(builder.dropped))
+
+    return builder
+
+# cache（llmcache.LLMCache）用于批量评论等离线调用：同样的图片、参考信息和问题直接复用上次的回答
+def call_vllm(client,GPT_MODEL,kg,user_instruction,target_image_path,image_filenames,cache=None):
+    builder = build_vllm_messages(kg, user_instruction, target_image_path, image_filenames)
+    messages = builder.build()
+    if cache is not None:
+        res = cache.get(GPT_MODEL, messages, max_tokens=400)
+        record_cache("llm", res is not None)
+        if res is not None:
+            return res
 
     # 调用模型
-    response = client.chat.completions.create(
-        model=GPT_MODEL,
-        messages=[
-            {
-                "role": "user",
-                "content": user_content  
-            }
-        ],
-        max_tokens=400,
-    )
+    with span("vision_generate", model=GPT_MODEL, payload_bytes=builder.payload_bytes,
+              input_tokens=builder.estimated_tokens, dropped=len(builder.dropped)) as sp:
+        response = client.chat.completions.create(
+            model=GPT_MODEL,
+            messages=messages,
+            max_tokens=400,
+        )
+        if response.usage is not None:
+            sp.set(prompt_tokens=response.usage.prompt_tokens, output_tokens=response.usage.completion_tokens)
+            inc("gallery_llm_output_tokens_total", response.usage.completion_tokens, model=GPT_MODEL)
 
     res=response.choices[0].message.content
-    return res
\ No newline at end of file
+    if cache is not None and res:
+        cache.put(GPT_MODEL, messages, res, max_tokens=400)
+    return res
+
+# 流式调用：逐token产出回答；on_stage(name)在进入每个阶段时被调用
+def call_vllm_stream(client,GPT_MODEL,kg,user_instruction,target_image_path,image_filenames,on_stage=None,
+                     target=None,references=None):
+    stage = on_stage or (lambda name: None)
+    stage("encode")
+    builder = build_vllm_messages(kg, user_instruction, target_image_path, image_filenames, target, references)
+
+    stage("generate")
+    # 流式回答的片段数近似为输出token数
+    with span("vision_generate", model=GPT_MODEL, payload_bytes=builder.payload_bytes,
+              input_tokens=builder.estimated_tokens, dropped=len(builder.dropped)) as sp:
+        response = client.chat.completions.create(
+            model=GPT_MODEL,
+            messages=builder.build(),
+            max_tokens=400,
+            stream=True,
+        )
+        tokens = 0
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if tokens == 0:
+                    sp.set(ttft_ms=round(sp.elapsed() * 1000, 2))
+                tokens += 1
+                yield chunk.choices[0].delta.content
+        sp.set(output_tokens=tokens)
+    inc("gallery_llm_output_tokens_total", tokens, model=GPT_MODEL)
+    observe("gallery_llm_output_tokens", tokens, buckets=TOKEN_BUCKETS, model=GPT_MODEL)
\ No newline at end of file